@@ -0,0 +1,126 @@
+"""
+A module contains benchmarks for the reading functions based on synthetic workbooks
+"""
+
+import os
+import pickle
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import openpyxl
+import pandas as pd
+from excel_operations.io import _read_table, READING_ENGINES, CALAMINE_SUPPORT
+from excel_operations.storage import ARROW_SUPPORT, dump_ipc, load_ipc
+
+
+def form_synthetic_xlsx(full_path: str, rows: int = 100_000, cols: int = 20, seed: int = 0) -> str:
+    """
+    Forms a System-like workbook with mixed value types: short categories, free text, numbers, dates and empty cells
+    :param full_path: full path to the target file (including file name and extension)
+    :param rows: number of data rows
+    :param cols: number of columns
+    :param seed: random seed, so the same workbook is formed for the same parameters
+    :return: full path to the formed file
+    """
+    rnd = random.Random(seed)
+    categories = ["Парк 1", "Парк 2", "Парк 3", "Выезд", "Заезд", "Высокий", "Низкий"]
+    start_date = datetime(2023, 1, 1)
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append([f"Колонка {i}" for i in range(cols)])
+    for row_num in range(rows):
+        row = []
+        for col_num in range(cols):
+            kind = col_num % 5
+            if kind == 0:
+                row.append(rnd.choice(categories))
+            elif kind == 1:
+                row.append(f"Задача №{rnd.randint(0, 99999):05d} гар. {rnd.randint(1000, 9999)}")
+            elif kind == 2:
+                row.append(rnd.randint(0, 10 ** 6) if rnd.random() > 0.5 else rnd.random() * 1000)
+            elif kind == 3:
+                row.append(start_date + timedelta(minutes=rnd.randint(0, 525600)))
+            else:
+                row.append(None if rnd.random() > 0.3 else "")
+        sheet.append(row)
+    workbook.save(full_path)
+
+    return full_path
+
+
+def benchmark_engines(rows: int = 100_000, cols: int = 20, repeats: int = 1,
+                      engines: list[str] = None) -> pd.DataFrame:
+    """
+    Compares the reading engines on a synthetic workbook. Each engine's output is checked against the default one
+    :param rows: number of data rows in the workbook
+    :param cols: number of columns in the workbook
+    :param repeats: number of readings per engine. The best time is taken
+    :param engines: engines to compare. All supported ones by default
+    :return: pd.DataFrame with timings in seconds and output check results
+    """
+    _engines = list(READING_ENGINES if engines is None else engines)
+    if "calamine" in _engines and not CALAMINE_SUPPORT:
+        print("python-calamine is not installed, skipping calamine engine")
+        _engines.remove("calamine")
+
+    res = pd.DataFrame(columns=["seconds", "identical"], index=_engines)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"Forming a synthetic workbook: {rows} rows, {cols} columns...")
+        path = form_synthetic_xlsx(os.path.join(tmp_dir, "synthetic.xlsx"), rows, cols)
+
+        reference = None
+        for engine in _engines:
+            best_time = None
+            table = None
+            for _ in range(max(repeats, 1)):
+                start = time.perf_counter()
+                table = _read_table(path, engine)
+                elapsed = time.perf_counter() - start
+                best_time = elapsed if best_time is None else min(best_time, elapsed)
+
+            if reference is None:
+                reference = _read_table(path) if engine != "default" else table
+            res.loc[engine, "seconds"] = round(best_time, 3)
+            res.loc[engine, "identical"] = reference.equals(table)
+            print(f"Engine '{engine}': {best_time:.3f} s")
+
+    return res
+
+
+def benchmark_transfer(rows: int = 100_000, cols: int = 20) -> pd.DataFrame | None:
+    """
+    Compares the ways of passing a read table between processes: pickling and Arrow IPC files. \n
+    Both ways are measured as a full round trip (serialization on the worker side and deserialization on the parent one)
+    :param rows: number of data rows in the synthetic table
+    :param cols: number of columns in the synthetic table
+    :return: pd.DataFrame with bytes transferred and timings in seconds, None if pyarrow is not installed
+    """
+    if not ARROW_SUPPORT:
+        print("pyarrow is not installed, nothing to compare")
+        return None
+
+    res = pd.DataFrame(columns=["bytes", "seconds"], index=["pickle", "arrow"])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"Forming a synthetic table: {rows} rows, {cols} columns...")
+        table = _read_table(form_synthetic_xlsx(os.path.join(tmp_dir, "synthetic.xlsx"), rows, cols), "calamine")
+
+        start = time.perf_counter()
+        dumped = pickle.dumps(table, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.loads(dumped)
+        res.loc["pickle", :] = [len(dumped), round(time.perf_counter() - start, 3)]
+
+        start = time.perf_counter()
+        transferred_bytes = dump_ipc(table, os.path.join(tmp_dir, "table.arrow"))
+        load_ipc(os.path.join(tmp_dir, "table.arrow"))
+        res.loc["arrow", :] = [transferred_bytes, round(time.perf_counter() - start, 3)]
+
+    print(f"Time saved by Arrow IPC transfer: {res.loc['pickle', 'seconds'] - res.loc['arrow', 'seconds']:.3f} s")
+    return res
+
+
+if __name__ == "__main__":
+    print(benchmark_engines())
+    print(benchmark_transfer())
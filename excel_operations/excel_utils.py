@@ -4,13 +4,34 @@ A module contains utility functions needed for excel parsing
 
 import calendar
 import locale
+from functools import lru_cache
 from datetime import datetime, time, date
 
 import openpyxl
+import numpy as np
 import pandas as pd
 from dateutil import parser
 import re
 from settings.defaults import GlobalDefaults
+from excel_operations.storage import ARROW_SUPPORT
+
+
+# Month names of the report locale, resolved once (see _get_month_names())
+_month_names: np.ndarray | None = None
+
+
+def _get_month_names() -> np.ndarray:
+    """
+    Sets the report locale and forms the month names lookup array. Both are done only once per run
+    :return: array of full month names, index is the month number (0 is an empty string)
+    """
+    global _month_names
+
+    if _month_names is None:
+        locale.setlocale(locale.LC_ALL, 'ru_RU')
+        _month_names = np.array([str(i) for i in calendar.month_name], dtype=object)
+
+    return _month_names
 
 
 def transform_date(source_col: list[str], date_pattern: str = None,
@@ -27,45 +48,31 @@ def transform_date(source_col: list[str], date_pattern: str = None,
     :keyword week: a flag indicating whether the week number column is needed or not. Default is False
     :return: pd.DataFrame, consisting of the desire columns
     """
-    locale.setlocale(locale.LC_ALL, 'ru_RU')
-    search_res = {GlobalDefaults.parsed_date: date_to_datetime(source_col)}
+    month_names = _get_month_names()
     _date_pattern = date_pattern
     if _date_pattern is None:
         _date_pattern = str(GlobalDefaults.datetime_preferred_format)
 
-    add_year = kwargs.get("year", False)
-    add_month = kwargs.get("month", False)
-    add_day = kwargs.get("day", False)
-    add_hour = kwargs.get("hour", False)
-    add_week = kwargs.get("week", False)
-    add_datetime = kwargs.get("datetime", False)
-
-    if add_datetime:
-        search_res[GlobalDefaults.date] = []
-    if add_year:
-        search_res[GlobalDefaults.year] = []
-    if add_month:
-        search_res[GlobalDefaults.month] = []
-    if add_day:
-        search_res[GlobalDefaults.day] = []
-    if add_hour:
-        search_res[GlobalDefaults.hour] = []
-    if add_week:
-        search_res[GlobalDefaults.week] = []
-
-    for row_elem in search_res[GlobalDefaults.parsed_date]:
-        if add_datetime:
-            search_res[GlobalDefaults.date] += [row_elem.strftime(_date_pattern)]
-        if add_year:
-            search_res[GlobalDefaults.year] += [str(row_elem.year)]
-        if add_month:
-            search_res[GlobalDefaults.month] += [str(calendar.month_name[row_elem.month])]
-        if add_day:
-            search_res[GlobalDefaults.day] += [str(row_elem.day)]
-        if add_hour:
-            search_res[GlobalDefaults.hour] += [str(row_elem.hour)]
-        if add_week:
-            search_res[GlobalDefaults.week] += [str(row_elem.isocalendar()[1])]
+    # Each unique value is processed once, the results are spread back by the codes
+    codes, uniques = pd.factorize(pd.Series(source_col, dtype=object), use_na_sentinel=False)
+    parsed = date_to_datetime(list(uniques))
+    parsed_dates = pd.Series(np.array(parsed, dtype="datetime64[us]")).dt
+
+    search_res = {GlobalDefaults.parsed_date: np.array(parsed, dtype=object)[codes].tolist()}
+    if kwargs.get("datetime", False):
+        formatted = np.array([i.strftime(_date_pattern) for i in parsed], dtype=object)
+        search_res[GlobalDefaults.date] = formatted[codes].tolist()
+    if kwargs.get("year", False):
+        search_res[GlobalDefaults.year] = parsed_dates.year.astype(str).to_numpy(dtype=object)[codes].tolist()
+    if kwargs.get("month", False):
+        search_res[GlobalDefaults.month] = month_names[parsed_dates.month.to_numpy()][codes].tolist()
+    if kwargs.get("day", False):
+        search_res[GlobalDefaults.day] = parsed_dates.day.astype(str).to_numpy(dtype=object)[codes].tolist()
+    if kwargs.get("hour", False):
+        search_res[GlobalDefaults.hour] = parsed_dates.hour.astype(str).to_numpy(dtype=object)[codes].tolist()
+    if kwargs.get("week", False):
+        weeks = parsed_dates.isocalendar().week.astype(str).to_numpy(dtype=object)
+        search_res[GlobalDefaults.week] = weeks[codes].tolist()
 
     return pd.DataFrame.from_dict(search_res)
 
@@ -111,95 +118,370 @@ def parse_date_value(val: str) -> str:
     return res_val
 
 
-def date_to_datetime(source: str | list[str]) -> datetime | list[datetime]:
+# Excel serial dates: days since the Windows epoch, the fake 1900-02-29 is skipped for the first 60 days
+_EXCEL_EPOCH = np.datetime64("1899-12-30", "D")
+_EXCEL_MAX_DAY = 2958465  # 9999-12-31
+_MS_PER_DAY = 86_400_000
+_NUMERIC_PATTERN = r"\s*[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?\s*"
+# Directives pandas parses differently from datetime.strptime() (timezones, locale formats). Bulk parsing stops at
+# the first format containing any of them, the rest of the formats are tried value by value
+_NON_BULK_FORMAT_DIRECTIVES = ("%z", "%Z", "%c", "%x", "%X")
+
+
+def _single_date_conversion(source_val: str) -> datetime:
     """
-    Converts a single string value or a list of date values to a list of datetimes.
-    Incorrect dates are replaced with min datetime
-    :param source: source str value or list of values containing date
-    :return: converted date or list of dates
+    Converts a single string value to datetime: Excel serial date, common formats, fuzzy parsing
+    :param source_val: source value
+    :return: converted date, min datetime on failure
     """
-    def single_conversion(source_val: str) -> datetime:
-        default_datetime = datetime.min
+    default_datetime = datetime.min
+
+    new_val = source_val
+
+    # Trying to convert float or int Excel date string to datetime object
+    try:
+        float_val = float(new_val)
+        res = openpyxl.utils.datetime.from_excel(float(float_val))
+        if isinstance(res, time):
+            res = datetime(year=default_datetime.year, month=default_datetime.month, day=default_datetime.day,
+                           hour=res.hour, minute=res.minute, second=res.second)
+        elif isinstance(res, date):
+            res = datetime(year=res.year, month=res.month, day=res.day)
+        return res
+    except (ValueError, TypeError, OverflowError, OSError) as err:
+        pass
 
-        new_val = source_val
+    # Some substitutions if needed
+    new_val = parse_date_value(new_val)
 
-        # Trying to convert float or int Excel date string to datetime object
+    # Trying some common formats
+    common_formats = GlobalDefaults.datetime_formats
+
+    for dt_format in common_formats:
         try:
-            float_val = float(new_val)
-            res = openpyxl.utils.datetime.from_excel(float(float_val))
-            if isinstance(res, time):
-                res = datetime(year=default_datetime.year, month=default_datetime.month, day=default_datetime.day,
-                               hour=res.hour, minute=res.minute, second=res.second)
-            elif isinstance(res, date):
-                res = datetime(year=res.year, month=res.month, day=res.day)
-            return res
-        except (ValueError, TypeError, OverflowError, OSError) as err:
-            pass
+            return datetime.strptime(new_val, dt_format)
+        except ValueError:
+            continue
 
-        # Some substitutions if needed
-        new_val = parse_date_value(new_val)
+    # By default, we will parse everything
+    try:
+        return parser.parse(new_val, dayfirst=True, fuzzy=True, default=default_datetime)
+    except parser.ParserError:
+        return default_datetime
 
-        # Trying some common formats
-        common_formats = GlobalDefaults.datetime_formats
 
-        for dt_format in common_formats:
-            try:
-                return datetime.strptime(new_val, dt_format)
-            except ValueError:
-                continue
+def _excel_serials_to_datetime(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized version of the Excel serial date conversion used in _single_date_conversion()
+    (openpyxl.utils.datetime.from_excel() with the result truncated to date or time)
+    :param values: float array
+    :return: datetime64[us] array and a mask of the values converted
+    """
+    day = np.floor(values)
+    fraction = values - day
+    with np.errstate(invalid="ignore"):
+        ms = np.round(fraction * 86400 * 1000)
 
-        # By default, we will parse everything
-        try:
-            return parser.parse(new_val, dayfirst=True, fuzzy=True, default=default_datetime)
-        except parser.ParserError:
-            return default_datetime
+    # Values below 1 are pure time values (rounded to seconds, date part is min datetime)
+    is_time = (values >= 0) & (values < 1) & (ms < _MS_PER_DAY)
+    # Others are dates: the time part is dropped, but it still might round up to the next day
+    days = day + ((values > 0) & (values < 60)) + (ms >= _MS_PER_DAY)
+    is_date = ~is_time & (values >= 0) & (days <= _EXCEL_MAX_DAY)
 
+    res = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[us]")
+    res[is_time] = (np.datetime64(datetime.min, "us")
+                    + (ms[is_time] // 1000).astype("int64").astype("timedelta64[s]"))
+    res[is_date] = _EXCEL_EPOCH + days[is_date].astype("int64").astype("timedelta64[D]")
+
+    return res, is_time | is_date
+
+
+def _parse_date_values(values: pd.Series) -> pd.Series:
+    """
+    Vectorized version of parse_date_value()
+    :param values: str values
+    :return: parsed values. Values parse_date_value() fails on are replaced with None
+    """
+    res = values.str.replace("  ", " ", regex=False)
+    has_space = res.str.contains(" ", regex=False)
+    if not has_space.any():
+        return res
+
+    spaced = res[has_space].str.replace(r"^ ", "", regex=True).str.replace(r" $", "", regex=True)
+    # Nothing left to split by (e.g., ' 01.01.2023')
+    spaced = spaced.where(spaced.str.contains(" ", regex=False), None)
+
+    # Delimiters substitution, only the values containing such delimiters are split
+    to_split = spaced.str.contains(r"[-/,]", regex=True).fillna(False).astype(bool)
+    if to_split.any():
+        parts = spaced[to_split].str.partition(" ")
+        date_vals = parts[0].str.replace("-", ".", regex=False).str.replace("/", ".", regex=False) \
+            .str.replace(",", ".", regex=False)
+        time_vals = parts[2].str.replace("-", ":", regex=False).str.replace("/", ":", regex=False) \
+            .str.replace(",", ".", regex=False)
+        spaced.loc[to_split] = date_vals + " " + time_vals
+    res.loc[has_space] = spaced
+
+    return res
+
+
+def _bulk_date_conversion(source: list) -> list[datetime]:
+    """
+    Vectorized version of _single_date_conversion() applied to a list. Each unique value is converted once:
+    Excel serial dates are converted with NumPy, the rest are parsed with pd.to_datetime() format by format.
+    Only the values left after that are converted one by one
+    :param source: list of source values
+    :return: list of converted dates
+    """
+    codes, uniques = pd.factorize(pd.Series(source, dtype=object), use_na_sentinel=False)
+    uniques = pd.Series(uniques, dtype=object)
+    res = pd.Series(np.datetime64("NaT"), index=uniques.index, dtype="datetime64[us]")
+    is_str = uniques.map(type) == str
+    remaining = pd.Series(False, index=uniques.index)
+
+    # Excel serial dates. Numbers out of the supported range are left for the slow path
+    str_vals = uniques[is_str].astype(pd.StringDtype("pyarrow") if ARROW_SUPPORT else str)
+    is_numeric = str_vals.str.fullmatch(_NUMERIC_PATTERN)
+    if is_numeric.any():
+        numeric_vals = str_vals[is_numeric]
+        converted, is_converted = _excel_serials_to_datetime(numeric_vals.str.strip().astype(float).to_numpy())
+        res.loc[numeric_vals.index[is_converted]] = converted[is_converted]
+        remaining.loc[numeric_vals.index[~is_converted]] = True
+
+    # Common formats one by one on the rest of the values. pandas treats some words as dates ('now', 'today'),
+    # so only the values with digits are parsed here
+    to_parse = str_vals[~is_numeric & str_vals.str.contains(r"\d", regex=True)]
+    parsed_vals = _parse_date_values(to_parse).dropna()
+    for dt_format in GlobalDefaults.datetime_formats:
+        if len(parsed_vals) == 0 or any(i in dt_format for i in _NON_BULK_FORMAT_DIRECTIVES):
+            break
+        parsed = pd.to_datetime(parsed_vals, format=dt_format, errors="coerce")
+        is_parsed = parsed.notna()
+        res.loc[parsed.index[is_parsed]] = parsed[is_parsed].to_numpy().astype("datetime64[us]")
+        parsed_vals = parsed_vals[~is_parsed]
+
+    # Everything else (fuzzy parsing, non-str values, etc.) goes value by value
+    remaining |= res.isna()
+    res = res.to_numpy().astype(object)
+    for indx in np.flatnonzero(remaining.to_numpy()):
+        res[indx] = _single_date_conversion(uniques[indx])
+
+    return res[codes].tolist()
+
+
+def date_to_datetime(source: str | list[str]) -> datetime | list[datetime]:
+    """
+    Converts a single string value or a list of date values to a list of datetimes.
+    Incorrect dates are replaced with min datetime
+    :param source: source str value or list of values containing date
+    :return: converted date or list of dates
+    """
     if isinstance(source, str):
-        return single_conversion(source)
+        return _single_date_conversion(source)
     elif isinstance(source, list):
-        return list(map(single_conversion, source))
+        return _bulk_date_conversion(source)
     else:
         raise ValueError(f"Incorrect argument, type: {type(source)}")
 
 
-def get_garage_num(source: list[str] | str) -> str | list[str]:
+# Garage codes memo shared between the calls (e.g., tasks and checks tables, chunks of a single table), so repeated
+# headers are parsed once. It is bound to the pattern and NA value it was formed with and cleared when it's too large
+GARAGE_NUM_MEMO_SIZE = 500_000
+_garage_num_memo: dict[str, str] = {}
+_garage_num_memo_key: tuple = (None, None)
+
+
+@lru_cache(maxsize=8)
+def _compile_pattern(pattern: str) -> re.Pattern:
+    """
+    A small wrapper for regex compilation, each pattern is compiled once
+    :param pattern: source pattern
+    :return: compiled pattern
+    """
+    return re.compile(pattern)
+
+
+def _single_garage_num(source_val: str, pattern: re.Pattern) -> str:
     """
-    Forms a vehicle garage code value or column based on the source
-    :param source: list with source values, each value's copy is converted to string by force
-    :return: str value or list of parsed code(s)
+    Parses a single vehicle garage code: the first non-empty match (group) stripped of leading zeros
+    :param source_val: source value
+    :param pattern: compiled garage code pattern
+    :return: parsed code, NA value if there is none
     """
-    search_res = []
+    try:
+        tmp_res = re.findall(pattern, source_val)
+        if len(tmp_res) > 0:
+            # Expecting list of tuples
+            if isinstance(tmp_res[0], tuple):
+                for list_elem in tmp_res:
+                    for tuple_elem in list_elem:
+                        if tuple_elem != "":
+                            # Any match stripped of possible 0's in the beginning
+                            return str(int(tuple_elem))
+            # List of strings otherwise
+            else:
+                for list_elem in tmp_res:
+                    if list_elem != "":
+                        return str(int(list_elem))
+
+        # No matches at all
+        return GlobalDefaults.na_val
 
-    def single_conversion(source_val: str) -> str:
-        pattern = re.compile(str(GlobalDefaults.garage_num_pattern))
-        _default_na = GlobalDefaults.na_val
+    # Doesn't contain the value at all
+    except ValueError as err:
+        return GlobalDefaults.na_val
 
+
+def _bulk_garage_num(values: pd.Series, pattern: re.Pattern) -> pd.Series:
+    """
+    Vectorized version of _single_garage_num() for str values
+    :param values: source str values
+    :param pattern: compiled garage code pattern
+    :return: parsed codes with the same index
+    """
+    _pattern = pattern if pattern.groups > 0 else re.compile(f"({pattern.pattern})", pattern.flags)
+    res = pd.Series(GlobalDefaults.na_val, index=values.index, dtype=object)
+    if len(values) == 0:
+        return res
+
+    # All the groups of all the matches in the order of appearance, the first non-empty one is taken
+    matches = values.str.extractall(_pattern).stack()
+    matches = matches[matches != ""]
+    first_match = matches.groupby(level=0, sort=False).first()
+
+    # Stripping leading zeros. Anything but plain digits is converted the same way as a single value is
+    is_digit = first_match.str.fullmatch(r"[0-9]+")
+    res.loc[first_match.index[is_digit]] = first_match[is_digit].str.lstrip("0").replace("", "0")
+    for indx, val in first_match[~is_digit].items():
         try:
-            tmp_res = re.findall(pattern, source_val)
-            if len(tmp_res) > 0:
-                # Expecting list of tuples
-                if isinstance(tmp_res[0], tuple):
-                    for list_elem in tmp_res:
-                        for tuple_elem in list_elem:
-                            if tuple_elem != "":
-                                # Any match stripped of possible 0's in the beginning
-                                return str(int(tuple_elem))
-                # List of strings otherwise
-                else:
-                    for list_elem in tmp_res:
-                        if list_elem != "":
-                            return str(int(list_elem))
-
-            # No matches at all
-            return GlobalDefaults.na_val
-
-        # Doesn't contain the value at all
+            res.loc[indx] = str(int(val))
         except ValueError as err:
-            return GlobalDefaults.na_val
+            pass
+
+    return res
+
+
+def get_garage_num(source: list[str] | str | pd.Series) -> str | list[str] | pd.Series:
+    """
+    Forms a vehicle garage code value or column based on the source. Each unique value is parsed once
+    :param source: list or pd.Series with source values or a single value
+    :return: str value, list or pd.Series (the same index as the source one) of parsed code(s)
+    """
+    global _garage_num_memo, _garage_num_memo_key
+
+    pattern = _compile_pattern(str(GlobalDefaults.garage_num_pattern))
 
     if isinstance(source, str):
-        return single_conversion(source)
-    elif isinstance(source, list):
-        return list(map(single_conversion, source))
-    else:
+        return _single_garage_num(source, pattern)
+    elif not isinstance(source, (list, pd.Series)):
         raise ValueError(f"Incorrect argument, type: {type(source)}")
+
+    # Memo is valid only for the same settings
+    memo_key = (pattern.pattern, GlobalDefaults.na_val)
+    if _garage_num_memo_key != memo_key or len(_garage_num_memo) > GARAGE_NUM_MEMO_SIZE:
+        _garage_num_memo = {}
+        _garage_num_memo_key = memo_key
+
+    codes, uniques = pd.factorize(pd.Series(source, dtype=object), use_na_sentinel=False)
+    uniques = pd.Series(uniques, dtype=object)
+    res = uniques.map(lambda x: _garage_num_memo.get(x) if isinstance(x, str) else None)
+
+    # Parsing only the new values, non-str ones are processed as they are
+    is_new = res.isna()
+    is_str = uniques.map(type) == str
+    new_vals = _bulk_garage_num(uniques[is_new & is_str].astype(str), pattern)
+    res.loc[new_vals.index] = new_vals
+    for indx in uniques.index[is_new & ~is_str]:
+        res.loc[indx] = _single_garage_num(uniques[indx], pattern)
+    _garage_num_memo.update(zip(uniques[new_vals.index], new_vals))
+
+    res = res.to_numpy(dtype=object)[codes]
+    if isinstance(source, pd.Series):
+        return pd.Series(res, index=source.index, name=source.name, dtype=object)
+
+    return res.tolist()
+
+
+def compact_table(table: pd.DataFrame,
+                  max_unique_ratio: float = 0.05,
+                  exclude: list[str] = None,
+                  table_name: str = "") -> pd.DataFrame:
+    """
+    Shrinks memory usage of a table read with dtype=str. Low-cardinality string columns (parks, branches, stages,
+    priorities, etc.) are converted to category dtype, the rest of string columns to string[pyarrow] dtype
+    (if pyarrow is installed). Columns with non-string values are left as they are
+    :param table: source table
+    :param max_unique_ratio: max ratio of unique values to rows count for a column to be considered low-cardinality
+    :param exclude: names of the columns to leave as they are
+    :param table_name: table name for the report
+    :return: compacted pd.DataFrame
+    """
+    if table is None or table.empty:
+        return table
+
+    _exclude = set() if exclude is None else set(exclude)
+    max_unique = max(int(len(table.index) * max_unique_ratio), 1)
+    memory_before = table.memory_usage(deep=True).sum()
+
+    res = table.copy(deep=False)
+    for col in res.columns:
+        if col in _exclude or not (pd.api.types.is_object_dtype(res[col]) or pd.api.types.is_string_dtype(res[col])):
+            continue
+        if isinstance(res[col].dtype, pd.CategoricalDtype) or pd.api.types.infer_dtype(res[col]) != "string":
+            continue
+
+        if res[col].nunique() <= max_unique:
+            # The default NA value is added beforehand, so the table might be filled with it later
+            res[col] = res[col].astype("category")
+            if GlobalDefaults.na_val is not None and GlobalDefaults.na_val not in res[col].cat.categories:
+                res[col] = res[col].cat.add_categories(GlobalDefaults.na_val)
+        elif ARROW_SUPPORT:
+            res[col] = res[col].astype(pd.StringDtype("pyarrow"))
+
+    memory_after = res.memory_usage(deep=True).sum()
+    _name = f"'{table_name}' " if table_name != "" else ""
+    print(f"Table {_name}compacted: {memory_before} -> {memory_after} bytes "
+          f"({memory_before - memory_after} bytes saved)")
+
+    return res
+
+
+def unify_categories(tables: list[pd.DataFrame], max_unique_ratio: float = 0.05) -> list[pd.DataFrame]:
+    """
+    Aligns the category columns of the tables compacted separately (see compact_table()), so they keep category dtype
+    on concatenation: pandas concatenates categoricals with different categories to object dtype. A column stays
+    category in all the tables if the unique values of all the tables make a low-cardinality column, the shared
+    categories are in their first appearance order. Otherwise it's converted to string[pyarrow] dtype (if pyarrow is
+    installed) or object one
+    :param tables: compacted tables
+    :param max_unique_ratio: max ratio of unique values to rows count for a column to be considered low-cardinality
+    :return: list of tables with the aligned dtypes
+    """
+    res = [i.copy(deep=False) if i is not None else None for i in tables]
+    valid = [i for i in res if i is not None and not i.empty]
+    columns = {col for table in valid for col in table.columns if isinstance(table[col].dtype, pd.CategoricalDtype)}
+
+    unified = 0
+    for col in sorted(columns):
+        with_col = [i for i in valid if col in i.columns]
+        categories = pd.Index([], dtype=object)
+        for table in with_col:
+            vals = table[col].cat.categories if isinstance(table[col].dtype, pd.CategoricalDtype) \
+                else pd.Index(table[col].dropna().unique())
+            categories = categories.append(vals[~vals.isin(categories)])
+
+        # The categories are checked the same way as for a single table
+        if len(categories) <= max(int(sum(len(i.index) for i in with_col) * max_unique_ratio), 1):
+            dtype = pd.CategoricalDtype(categories)
+            for table in with_col:
+                table[col] = table[col].cat.set_categories(categories) \
+                    if isinstance(table[col].dtype, pd.CategoricalDtype) else table[col].astype(dtype)
+        else:
+            for table in with_col:
+                table[col] = table[col].astype(pd.StringDtype("pyarrow") if ARROW_SUPPORT else object)
+        unified += 1
+
+    if unified > 0:
+        print(f"Category columns aligned for {len(valid)} table(s): {unified}")
+
+    return res
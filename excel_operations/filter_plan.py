@@ -0,0 +1,160 @@
+"""
+A module contains a compiled filter engine: a declarative filter spec is turned into a plan which is applied to tables
+"""
+
+import re
+import time
+import numpy as np
+import pandas as pd
+
+FILTER_OPERATIONS = ("eq", "isin", "match")
+EMPTY_MODES = (None, "allow", "forbid")
+
+
+def _lower(val) -> str:
+    """
+    The same lowercasing the filters used to apply to each value
+    :param val: source value
+    :return: lowercased string representation
+    """
+    return str(val).lower()
+
+
+class FilterPlan:
+    """
+    A compiled filter spec. The spec is a list of predicates, each one is a dictionary: \n
+    - name: predicate name for the report \n
+    - column: column name \n
+    - op: 'eq' (equals the value), 'isin' (one of the values) or 'match' (regex matching from the start) \n
+    - values: a value, a list of values or a regex pattern depending on the operation \n
+    - lower: a flag indicating whether the column values are lowercased (str(x).lower()) before the check. Default is True \n
+    - negate: a flag indicating whether the check result is inverted. Default is False \n
+    - empty: 'allow' to pass empty strings regardless of the check, 'forbid' to drop them. Default is None \n
+    All the predicates are combined with AND. Each predicate is evaluated only on the unique values of the rows passed
+    the previous ones, the most selective predicates (by the previous runs) go first
+    """
+    def __init__(self, spec: list[dict], name: str = ""):
+        """
+        Compiles the spec
+        :param spec: list of predicates
+        :param name: plan name for the report
+        :raises ValueError: on unknown operation or empty mode
+        """
+        self.name = name
+        self.predicates: list[dict] = []
+        for indx, predicate in enumerate(spec):
+            op = predicate.get("op", "eq")
+            empty = predicate.get("empty")
+            if op not in FILTER_OPERATIONS:
+                raise ValueError(f"Unknown filter operation: {op}. Supported ones: {FILTER_OPERATIONS}")
+            if empty not in EMPTY_MODES:
+                raise ValueError(f"Unknown empty values mode: {empty}. Supported ones: {EMPTY_MODES}")
+
+            values = predicate.get("values")
+            if op == "isin":
+                values = set(values)
+            elif op == "match":
+                values = re.compile(str(values))
+
+            self.predicates.append({"name": predicate.get("name", f"{predicate['column']} {op}"),
+                                    "column": predicate["column"], "op": op, "values": values,
+                                    "lower": predicate.get("lower", True), "negate": predicate.get("negate", False),
+                                    "empty": empty})
+
+        # Cumulative stats: {predicate name: [rows checked, rows passed, seconds]}
+        self.stats: dict[str, list] = {i["name"]: [0, 0, 0.] for i in self.predicates}
+        self.last_run: list[tuple[str, int, int, float]] = []
+
+    @property
+    def columns(self) -> set[str]:
+        """
+        :return: names of the columns the plan needs
+        """
+        return {i["column"] for i in self.predicates}
+
+    def _order(self) -> list[dict]:
+        """
+        Orders the predicates by their pass ratio during the previous runs, the most selective first.
+        Predicates with no stats keep the spec order
+        :return: ordered predicates
+        """
+        def pass_ratio(predicate: dict) -> float:
+            checked, passed, _ = self.stats[predicate["name"]]
+            return passed / checked if checked > 0 else 1.
+
+        return sorted(self.predicates, key=pass_ratio)
+
+    @staticmethod
+    def _evaluate(predicate: dict, uniques: pd.Series, lowered: dict) -> np.ndarray:
+        """
+        Evaluates a single predicate on the unique values of a column
+        :param predicate: compiled predicate
+        :param uniques: unique column values
+        :param lowered: lowercasing memo of the column {value: lowercased value}
+        :return: bool array, True for the values passing the predicate
+        """
+        vals = uniques
+        if predicate["lower"]:
+            for val in uniques:
+                if val not in lowered:
+                    lowered[val] = _lower(val)
+            vals = uniques.map(lowered.__getitem__)
+
+        if predicate["op"] == "eq":
+            res = (vals == predicate["values"]).to_numpy(dtype=bool)
+        elif predicate["op"] == "isin":
+            res = vals.isin(predicate["values"]).to_numpy(dtype=bool)
+        else:
+            res = vals.map(lambda x: isinstance(x, str) and predicate["values"].match(x) is not None) \
+                .to_numpy(dtype=bool)
+
+        if predicate["negate"]:
+            res = ~res
+
+        if predicate["empty"] is not None:
+            is_empty = uniques.map(lambda x: isinstance(x, str) and x == "").to_numpy(dtype=bool)
+            res = res | is_empty if predicate["empty"] == "allow" else res & ~is_empty
+
+        return res
+
+    def mask(self, table: pd.DataFrame) -> np.ndarray:
+        """
+        Applies the plan to the table
+        :param table: source table
+        :return: bool array, True for the rows passing all the predicates
+        """
+        alive = np.arange(len(table.index))
+        lowered: dict[str, dict] = {}
+        self.last_run = []
+
+        for predicate in self._order():
+            start = time.perf_counter()
+            rows_checked = len(alive)
+            if rows_checked > 0:
+                col = table[predicate["column"]]
+                col = col.iloc[alive] if rows_checked < len(col) else col
+                codes, uniques = pd.factorize(col.astype(object), use_na_sentinel=False)
+                passed = self._evaluate(predicate, pd.Series(uniques, dtype=object),
+                                        lowered.setdefault(predicate["column"], {}))
+                alive = alive[passed[codes]]
+
+            seconds = time.perf_counter() - start
+            stats = self.stats[predicate["name"]]
+            stats[0] += rows_checked
+            stats[1] += len(alive)
+            stats[2] += seconds
+            self.last_run.append((predicate["name"], rows_checked, len(alive), seconds))
+
+        res = np.zeros(len(table.index), dtype=bool)
+        res[alive] = True
+
+        return res
+
+    def report(self) -> None:
+        """
+        Prints the last run stats: rows checked and passed by each predicate (in the evaluation order) and the time spent
+        """
+        print(f"Filter plan {self.name} stats:")
+        for name, rows_checked, rows_passed, seconds in self.last_run:
+            selectivity = 1 - rows_passed / rows_checked if rows_checked > 0 else 0.
+            print(f"\t{name}: {rows_checked} -> {rows_passed} rows ({selectivity:.1%} dropped), {seconds:.4f} s")
@@ -3,32 +3,40 @@ A module contains common project read-write functions
 """
 
 import os
+import pickle
+import shutil
+import tempfile
+import time
 from datetime import datetime
 import pandas as pd
 import xlrd
 from pathos.multiprocessing import ProcessingPool as Pool
 import multiprocessing as mp
-from more_itertools import chunked_even
 import glob
 import warnings
-from utils.utils import form_file_name
+import importlib.util
+from typing import Literal, Iterator
+import openpyxl
+from utils.utils import form_file_name, validate_arg_type
+from excel_operations.storage import XlsxCache, DEFAULT_CACHE_SIZE_LIMIT, ARROW_SUPPORT, dump_ipc, load_ipc
+from excel_operations.excel_utils import compact_table, unify_categories
 
+READING_ENGINES = ("default", "openpyxl_stream", "calamine")
+CALAMINE_SUPPORT = importlib.util.find_spec("python_calamine") is not None
 
-def read_xlsx_files(
-                    xlsx_files_paths: list[str] | str = None,
-                    mp_support: bool = True,
-                    extensions: list[str] = None,
-                    fname_stamp: bool = True,
-                    date_stamp: bool = False
-                    ) -> list[pd.DataFrame]:
+# Number of rows of each table pickled to estimate the time saved by Arrow IPC transfer
+PICKLE_SAMPLE_ROWS = 10_000
+
+# Reader process pool shared between the calls, so the workers are spawned once per run
+_reader_pool: Pool | None = None
+
+
+def collect_paths(xlsx_files_paths: list[str] | str = None, extensions: list[str] = None) -> list[str]:
     """
-    Scans the folder and reads all Excel files from it. Assigning a number of file batches to separate processes
-    :param xlsx_files_paths: list with full file paths, full folder paths or none. If none set, method takes all Excel files in the current folder
-    :param mp_support: enabling multiprocessing support
+    Converts the given file and folder paths to a single list of file paths
+    :param xlsx_files_paths: list with full file paths, full folder paths or a single path
     :param extensions: supported extensions. xls and xlsx by default
-    :param date_stamp: a flag indicating that the table requires a separate column containing reading timestamp mark
-    :param fname_stamp: a flag indicating that the table requires a separate column containing file name
-    :return: a list of pd.DataFrames
+    :return: list of file paths
     :raises OSError: if no file paths were set for the reading
     """
     default_extensions = ["xls", "xlsx"]
@@ -57,58 +65,303 @@ def read_xlsx_files(
         else:
             tmp_path_list.append(path)
 
-    # Since it might be extended during parsing
-    new_path_list = tmp_path_list
+    return tmp_path_list
+
+
+def iter_xlsx_chunks(xlsx_files_paths: list[str] | str = None,
+                     chunk_rows: int = 50_000,
+                     extensions: list[str] = None,
+                     fname_stamp: bool = True,
+                     date_stamp: bool = False,
+                     usecols: list[str] = None,
+                     filters: dict[str, str | list[str]] = None
+                     ) -> Iterator[pd.DataFrame]:
+    """
+    Reads Excel files chunk by chunk, so only a single chunk is kept in memory at once. \n
+    Chunks have the same lowercased headers and stamps as read_xlsx_files() output. xlsx files are streamed by rows
+    (cells without a header are ignored), xls ones are read fully and then split
+    :param xlsx_files_paths: list with full file paths, full folder paths or a single path
+    :param chunk_rows: max number of rows in a chunk
+    :param extensions: supported extensions. xls and xlsx by default
+    :param fname_stamp: a flag indicating that the table requires a separate column containing file name
+    :param date_stamp: a flag indicating that the table requires a separate column containing reading timestamp mark
+    :param usecols: lowercased names of the columns to read, see read_xlsx_files()
+    :param filters: row predicates, see read_xlsx_files()
+    :return: iterator over pd.DataFrame chunks
+    :raises OSError: if no file paths were set for the reading
+    """
+    _chunk_rows = max(abs(chunk_rows), 1)
+
+    for f in collect_paths(xlsx_files_paths, extensions):
+        fname = os.path.basename(f.replace("\\", "/"))
+        chunks_num = 0
+        try:
+            if f.lower().endswith(".xls"):
+                table = _read_table(f, usecols=usecols, filters=filters)
+                chunks = (table.iloc[i: i + _chunk_rows].reset_index(drop=True)
+                          for i in range(0, len(table.index), _chunk_rows))
+            else:
+                chunks = _iter_xlsx_stream(f, _chunk_rows, usecols, filters)
+
+            for chunk in chunks:
+                # Stamping with fname
+                if fname_stamp:
+                    chunk["файл"] = fname
+
+                # Stamping with date
+                if date_stamp:
+                    chunk["дата чтения"] = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+
+                chunks_num += 1
+                yield chunk
+        # Expected errors
+        except (FileNotFoundError, PermissionError) as err:
+            print(f"No file was found by {f}, error message: {err.__str__()}. Skipping...")
+            continue
+        except UnicodeDecodeError as err:
+            print(f"An error occurred during file reading: {f}, error message: {err.__str__()}. Skipping...")
+            continue
+        except (xlrd.biffh.XLRDError, pd.errors.ParserError) as err:
+            print(f"An error occurred during file reading: {f}, error message: {err.__str__()}. "
+                  f"Please, check the file data and/or try to re-save it. Skipping...")
+            continue
+
+        print(f"File '{fname}' read successfully: {chunks_num} chunk(s)")
+
+
+def read_xlsx_files(
+                    xlsx_files_paths: list[str] | str = None,
+                    mp_support: bool = True,
+                    extensions: list[str] = None,
+                    fname_stamp: bool = True,
+                    date_stamp: bool = False,
+                    cache_dir: str = None,
+                    cache_size_limit: int = DEFAULT_CACHE_SIZE_LIMIT,
+                    engine: Literal["default", "openpyxl_stream", "calamine"] = "default",
+                    max_workers: int = None,
+                    transfer: Literal["pickle", "arrow"] = "pickle",
+                    usecols: list[str] = None,
+                    filters: dict[str, str | list[str]] = None,
+                    keep_paths: bool = False,
+                    compact: bool = False
+                    ) -> list[pd.DataFrame] | dict[str, pd.DataFrame]:
+    """
+    Scans the folder and reads all Excel files from it. Files are assigned to the pool workers one by one, the largest
+    ones first, so a single big file doesn't stall the others. The result order is the same as the paths order
+    :param xlsx_files_paths: list with full file paths, full folder paths or none. If none set, method takes all Excel files in the current folder
+    :param mp_support: enabling multiprocessing support
+    :param extensions: supported extensions. xls and xlsx by default
+    :param date_stamp: a flag indicating that the table requires a separate column containing reading timestamp mark
+    :param fname_stamp: a flag indicating that the table requires a separate column containing file name
+    :param cache_dir: folder for the persistent cache of parsed files. No caching is done if not set
+    :param cache_size_limit: max size of the cache in bytes. The least recently used files are evicted first
+    :param engine: Excel reading engine. 'default' is pandas' one, 'openpyxl_stream' is a read-only openpyxl reader of raw values, 'calamine' is a Rust-backed reader (python-calamine package required). The output is the same for any engine
+    :param max_workers: max number of reading processes. Default is the number of CPU cores
+    :param transfer: the way the workers send the read tables back. 'pickle' is the default one, 'arrow' passes them through Arrow IPC temporary files (pyarrow required), the string columns of such tables have string[pyarrow] dtype
+    :param usecols: lowercased names of the columns to read. Other columns are skipped during the parsing. All columns are read by default
+    :param filters: row predicates as {lowercased column name: allowed value or list of values}. Rows not matching all of them are dropped right after the parsing (during it for 'openpyxl_stream' engine). Predicates on the missing columns are ignored
+    :param keep_paths: a flag indicating that the result should be a dictionary {file path: table}
+    :param compact: a flag indicating that the read tables should be compacted: low-cardinality string columns are converted to category dtype with the categories shared by all the read tables, the others to string[pyarrow] one (see excel_utils.compact_table(), excel_utils.unify_categories())
+    :return: a list of pd.DataFrames or a dictionary {file path: pd.DataFrame} (only successfully read files are included)
+    :raises OSError: if no file paths were set for the reading
+    :raises ValueError: on unknown engine
+    """
+    # Engine check
+    if engine not in READING_ENGINES:
+        raise ValueError(f"Unknown reading engine: {engine}. Supported ones: {READING_ENGINES}")
+
+    new_path_list = collect_paths(xlsx_files_paths, extensions)
     files_num = len(new_path_list)
     if files_num <= 0:
         print("No files to read by the current path(s)")
-        return []
+        return {} if keep_paths else []
 
     xlsx_files = []
     res = []
     print("Initializing file reading...")
 
-    # Multiprocess reading by batches
+    # Multiprocess reading: one file per task, the largest files go first
     if mp_support:
-        # Getting cores count
-        n_cores = mp.cpu_count()
-
-        # Forming batches with file names based on max available batch size (up to n = cpu_cores batches)
-        batches = []
-        if files_num > n_cores:
-            # files_num // n_cores + 1 = batch length ||| 1 <= process_quantity <= cpu_cores
-            batches = list(chunked_even(new_path_list, files_num // n_cores + 1))
-        else:
-            batches = list(chunked_even(new_path_list, 1))
+        # Temporary folder for the tables passed through Arrow IPC files
+        transfer_dir = None
+        if transfer == "arrow":
+            if ARROW_SUPPORT:
+                transfer_dir = tempfile.mkdtemp(prefix="xlsx_transfer_")
+            else:
+                print("pyarrow is not installed, tables will be transferred by pickling")
+
+        tasks = [{"paths": [path], "fname_stamp": fname_stamp, "date_stamp": date_stamp, "cache_dir": cache_dir,
+                  "engine": engine, "position": indx, "transfer_dir": transfer_dir, "usecols": usecols,
+                  "filters": filters}
+                 for indx, path in enumerate(new_path_list)]
+        tasks.sort(key=lambda task: _file_size(task["paths"][0]), reverse=True)
+
+        # Workers take the next task as soon as they are free, results are put back in the paths order
+        results = [[] for _ in range(files_num)]
+        transferred_bytes, transfer_time, pickle_time = 0, 0., 0.
+        proc = _get_reader_pool(max_workers)
+        try:
+            for position, res_batch, (batch_bytes, batch_time, batch_pickle_time) in proc.uimap(_indexed_reading,
+                                                                                                   tasks):
+                start = time.perf_counter()
+                results[position] = [load_ipc(item) if isinstance(item, str) else item for item in res_batch]
+                transfer_time += batch_time + time.perf_counter() - start
+                transferred_bytes += batch_bytes
+                pickle_time += batch_pickle_time
+        finally:
+            if transfer_dir is not None:
+                # Files are memory-mapped by the read tables, on Windows they are kept till the tables are released
+                shutil.rmtree(transfer_dir, ignore_errors=True)
+                if os.path.isdir(transfer_dir):
+                    print(f"Some of the transfer files are still in use and are left in {transfer_dir}")
+
+        if transfer_dir is not None:
+            print(f"Arrow IPC transfer: {transferred_bytes} bytes in {transfer_time:.3f} s, "
+                  f"{pickle_time - transfer_time:.3f} s saved against pickling "
+                  f"(estimated by the first {PICKLE_SAMPLE_ROWS} rows of each table)")
+
+    # Consequential reading (file by file, so each table might be matched with its path)
+    else:
+        results = [raw_xlsx_reading(**{"paths": [path], "fname_stamp": fname_stamp, "date_stamp": date_stamp,
+                                        "cache_dir": cache_dir, "engine": engine, "usecols": usecols,
+                                        "filters": filters}) for path in new_path_list]
 
-        # Packing values for multiprocessing, assigning tasks to different processes
-        batches = [{"paths": i, "fname_stamp": fname_stamp, "date_stamp": date_stamp} for i in batches]
-        with Pool(nodes=len(batches)) as proc:
-            results = proc.map(raw_xlsx_reading, batches, chunksize=1)
+    # Shrinking memory usage of the read tables
+    if compact:
+        results = [[compact_table(item, table_name=os.path.basename(path)) for item in res_batch]
+                   for path, res_batch in zip(new_path_list, results)]
+        # Each file gets its own categories, they are shared, so the tables could be concatenated as they are
+        unified = iter(unify_categories([item for res_batch in results for item in res_batch]))
+        results = [[next(unified) for _ in res_batch] for res_batch in results]
 
-        # Merging the items of sublists into a single list
-        res = [item for res_batch in results for item in res_batch]
+    # Merging the items of sublists into a single list
+    res = [item for res_batch in results for item in res_batch]
 
-    # Consequential reading
-    else:
-        res = raw_xlsx_reading(**{"paths": new_path_list, "fname_stamp": fname_stamp, "date_stamp": date_stamp})
+    # Keeping the cache within the size limit
+    if cache_dir is not None:
+        XlsxCache(cache_dir, cache_size_limit).evict()
 
     print(f"Total files read: {len(res)}")
 
+    if keep_paths:
+        return {path: res_batch[0] for path, res_batch in zip(new_path_list, results) if len(res_batch) > 0}
+
     return res
 
 
+def _file_size(path: str) -> int:
+    """
+    A small wrapper for getting file size
+    :param path: path to the file
+    :return: file size in bytes, 0 if it's not available
+    """
+    try:
+        return os.path.getsize(path)
+    except OSError as err:
+        return 0
+
+
+def _get_reader_pool(max_workers: int = None) -> Pool:
+    """
+    Returns the reader process pool, spawning it only if there is no pool of the requested size yet
+    :param max_workers: number of processes. Default is the number of CPU cores
+    :return: process pool
+    """
+    global _reader_pool
+
+    n_workers = mp.cpu_count() if max_workers is None else max(1, max_workers)
+    if _reader_pool is not None and _reader_pool.nodes != n_workers:
+        close_reader_pool()
+    if _reader_pool is None:
+        _reader_pool = Pool(nodes=n_workers)
+        print(f"Reader pool started with {n_workers} worker(s)")
+
+    return _reader_pool
+
+
+def close_reader_pool() -> None:
+    """
+    Shuts down the reader process pool. A new one is spawned on the next multiprocess reading
+    :return: None
+    """
+    global _reader_pool
+
+    if _reader_pool is not None:
+        _reader_pool.close()
+        _reader_pool.join()
+        _reader_pool.clear()
+        _reader_pool = None
+
+    return None
+
+
+def _indexed_reading(task: dict) -> tuple[int, list[pd.DataFrame | str], tuple[int, float]]:
+    """
+    Worker wrapper for raw_xlsx_reading() keeping the task position, so the results order might be restored. \n
+    If the task contains 'transfer_dir', the tables are written to Arrow IPC files and only their paths are returned
+    (the tables which couldn't be written are returned as they are)
+    :param task: raw_xlsx_reading() parameters dictionary with additional 'position' and 'transfer_dir' keys
+    :return: the task position, the read tables (or paths to them) and the transfer stats: bytes written, seconds spent
+    and estimated seconds of pickling the written tables instead
+    """
+    tables = raw_xlsx_reading(task)
+    transfer_dir = task.get("transfer_dir")
+    if transfer_dir is None:
+        return task["position"], tables, (0, 0., 0.)
+
+    res, transferred_bytes, transfer_time, pickle_time = [], 0, 0., 0.
+    for indx, table in enumerate(tables):
+        path = os.path.join(transfer_dir, f"{task['position']}_{indx}.arrow")
+        start = time.perf_counter()
+        try:
+            transferred_bytes += dump_ipc(table, path)
+            res.append(path)
+        except (ValueError, TypeError, NotImplementedError, OSError) as err:
+            res.append(table)
+            continue
+        transfer_time += time.perf_counter() - start
+        pickle_time += _estimate_pickle_time(table)
+
+    return task["position"], res, (transferred_bytes, transfer_time, pickle_time)
+
+
+def _estimate_pickle_time(table: pd.DataFrame, sample_rows: int = PICKLE_SAMPLE_ROWS) -> float:
+    """
+    Estimates the time of passing the table between processes by pickling: a sample of the first rows is pickled and
+    unpickled, the time is scaled to the full table
+    :param table: source table
+    :param sample_rows: number of rows in the sample
+    :return: estimated seconds of the pickling round trip
+    """
+    sample = table.iloc[:max(sample_rows, 1)]
+    if len(sample.index) == 0:
+        return 0.
+
+    start = time.perf_counter()
+    pickle.loads(pickle.dumps(sample, protocol=pickle.HIGHEST_PROTOCOL))
+
+    return (time.perf_counter() - start) * len(table.index) / len(sample.index)
+
+
 def raw_xlsx_reading(*args, **kwargs) -> list[pd.DataFrame]:
     """
     Reads a batch of xlsx or xls files. Sorts the data frames by column order
     :keyword paths: list containing file paths to read
     :keyword fname_stamp: a flag indicating that the table requires a separate column containing file name
     :keyword date_stamp: a flag indicating that the table requires a separate column containing reading timestamp mark
+    :keyword cache_dir: folder for the persistent cache of parsed files. No caching is done if not set
+    :keyword engine: Excel reading engine, see read_xlsx_files(). Default is pandas' one
+    :keyword usecols: lowercased names of the columns to read, see read_xlsx_files()
+    :keyword filters: row predicates, see read_xlsx_files()
     :return: a list of read pd.DataFrames
     """
     xlsx_files_paths = []
     fname_stamp = True
     date_stamp = False
+    cache_dir = None
+    engine = "default"
+    usecols = None
+    filters = None
     # Arguments unpacking
     try:
         param_dict = args[0]
@@ -117,15 +370,27 @@ def raw_xlsx_reading(*args, **kwargs) -> list[pd.DataFrame]:
         if isinstance(param_dict["fname_stamp"], bool) and isinstance(param_dict["date_stamp"], bool):
             fname_stamp = param_dict["fname_stamp"]
             date_stamp = param_dict["date_stamp"]
+        cache_dir = param_dict.get("cache_dir")
+        engine = param_dict.get("engine", engine)
+        usecols = param_dict.get("usecols")
+        filters = param_dict.get("filters")
     except IndexError as err:
         if not kwargs:
             raise ValueError("No arguments passed to a function")
         xlsx_files_paths = kwargs.get("paths", [])
         fname_stamp = kwargs.get("fname_stamp", True)
         date_stamp = kwargs.get("date_stamp", False)
+        cache_dir = kwargs.get("cache_dir")
+        engine = kwargs.get("engine", engine)
+        usecols = kwargs.get("usecols")
+        filters = kwargs.get("filters")
 
     xlsx_files: list[pd.DataFrame] = []
     error_paths: list[str] = []
+    cache = XlsxCache(cache_dir) if cache_dir is not None else None
+    cache_hits = 0
+    # Projected and filtered tables are cached separately from the full ones
+    cache_variant = "" if usecols is None and filters is None else repr((usecols, _normalize_filters(filters)))
 
     # Loop over the list of xlsx files with reading them, disabling openpyxl warnings
     with warnings.catch_warnings(record=True):
@@ -133,7 +398,14 @@ def raw_xlsx_reading(*args, **kwargs) -> list[pd.DataFrame]:
         for f in xlsx_files_paths:
             is_error = False
             try:
-                xlsx_files.append(pd.read_excel(f, na_filter=False, dtype=str))
+                table = cache.get(f, cache_variant) if cache is not None else None
+                if table is not None:
+                    cache_hits += 1
+                else:
+                    table = _read_table(f, engine, usecols, filters)
+                    if cache is not None:
+                        cache.put(f, table, cache_variant)
+                xlsx_files.append(table)
 
                 # Getting pure file name
                 fpath = f
@@ -167,17 +439,281 @@ def raw_xlsx_reading(*args, **kwargs) -> list[pd.DataFrame]:
                     error_paths.append(f)
                     continue
 
-            # Converting the headers of the last DataFrame read to lowercase
-            xlsx_files[-1].columns = xlsx_files[-1].columns.str.lower()
-
     if len(error_paths) == 0:
         print(f"Worker at {os.getpid()}: {len(xlsx_files_paths)} file(s) read successfully")
     else:
         print(f"Files read successfully: {len(xlsx_files_paths) - len(error_paths)}, with errors: {len(error_paths)}")
+    if cache is not None:
+        print(f"Worker at {os.getpid()}: {cache_hits} file(s) taken from the cache")
 
     return xlsx_files
 
 
+def _convert_stream_cell(value) -> str:
+    """
+    Converts a raw openpyxl cell value the same way pandas does it for dtype=str reading
+    :param value: raw cell value
+    :return: string value
+    """
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+
+    return str(value)
+
+
+def _header_names(header: list) -> list:
+    """
+    Names the columns the same way pandas does: empty ones are named 'Unnamed: N', duplicated ones are mangled as
+    'name.N' (unnamed ones are mangled after the named ones)
+    :param header: raw header values, empty ones are ''
+    :return: list of column names
+    """
+    columns = [f"Unnamed: {indx}" if col == "" else col for indx, col in enumerate(header)]
+    unnamed = [indx for indx, col in enumerate(header) if col == ""]
+    counts = {}
+    for indx in [i for i in range(len(header)) if i not in unnamed] + unnamed:
+        col = old_col = columns[indx]
+        cur_count = counts.get(col, 0)
+        while cur_count > 0:
+            counts[old_col] = cur_count + 1
+            col = f"{old_col}.{cur_count}"
+            cur_count = cur_count + 1 if col in columns else counts.get(col, 0)
+        columns[indx] = col
+        counts[col] = cur_count + 1
+
+    return columns
+
+
+def _convert_header_cell(value):
+    """
+    Converts a raw openpyxl header cell value the same way pandas does it (header values keep their types)
+    :param value: raw cell value
+    :return: converted value, '' for the empty cells
+    """
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+
+    return value
+
+
+def _normalize_filters(filters: dict[str, str | list[str]] = None) -> dict[str, list[str]] | None:
+    """
+    Converts row predicates to {lowercased column name: sorted list of allowed string values}
+    :param filters: row predicates as {column name: allowed value or list of values}
+    :return: normalized predicates, None if there are none
+    """
+    if not filters:
+        return None
+
+    return {str(col).lower(): sorted({str(i) for i in validate_arg_type(vals)}) for col, vals in filters.items()}
+
+
+def _stream_projection(columns: list,
+                       usecols: list[str] = None,
+                       filters: dict[str, str | list[str]] = None) -> tuple[list[int], dict[int, set[str]]]:
+    """
+    Maps the columns to read and the row predicates to column positions for the streaming readers
+    :param columns: lowercased column names of the sheet
+    :param usecols: lowercased names of the columns to read. All columns by default
+    :param filters: row predicates as {column name: allowed value or list of values}
+    :return: positions of the columns to read and {position: allowed values} for the predicates
+    """
+    keep = list(range(len(columns)))
+    if usecols is not None:
+        wanted = {str(i).lower() for i in usecols}
+        keep = [indx for indx, col in enumerate(columns) if col in wanted]
+
+    predicates = {}
+    for col, vals in (_normalize_filters(filters) or {}).items():
+        if col not in columns:
+            warnings.warn(f"No '{col}' column in the table, the predicate is ignored")
+            continue
+        predicates[list(columns).index(col)] = set(vals)
+
+    return keep, predicates
+
+
+def _apply_projection(table: pd.DataFrame,
+                      usecols: list[str] = None,
+                      filters: dict[str, str | list[str]] = None) -> pd.DataFrame:
+    """
+    Drops the rows not matching the predicates and the columns not needed. Used for the non-streaming engines
+    :param table: read table with lowercased headers
+    :param usecols: lowercased names of the columns to keep. All columns by default
+    :param filters: row predicates as {column name: allowed value or list of values}
+    :return: filtered pd.DataFrame
+    """
+    res = table
+    normalized = _normalize_filters(filters)
+    if normalized is not None:
+        mask = pd.Series(True, index=res.index)
+        for col, vals in normalized.items():
+            if col not in res.columns:
+                warnings.warn(f"No '{col}' column in the table, the predicate is ignored")
+                continue
+            mask &= res[col].isin(vals)
+        res = res[mask].reset_index(drop=True)
+
+    if usecols is not None:
+        wanted = {str(i).lower() for i in usecols}
+        res = res.loc[:, [col for col in res.columns if col in wanted]]
+
+    return res
+
+
+def _iter_xlsx_stream(xlsx_path: str,
+                      chunk_rows: int = 50_000,
+                      usecols: list[str] = None,
+                      filters: dict[str, str | list[str]] = None) -> Iterator[pd.DataFrame]:
+    """
+    Streams the first sheet of the xlsx file by chunks with a read-only openpyxl workbook taking raw values only. \n
+    Values are converted the same way as in _read_xlsx_stream(). The columns are defined by the header row, so the cells
+    without a header are ignored. Trailing empty rows are trimmed
+    :param xlsx_path: path to the file
+    :param chunk_rows: max number of rows in a chunk
+    :param usecols: lowercased names of the columns to read. All columns by default
+    :param filters: row predicates as {column name: allowed value or list of values}
+    :return: iterator over pd.DataFrame chunks with lowercased headers
+    """
+    workbook = openpyxl.load_workbook(xlsx_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+
+        columns = None
+        keep, predicates = [], {}
+        data, empty_rows = [], []
+        for row in sheet.iter_rows(values_only=True):
+            if columns is None:
+                header = [_convert_header_cell(i) for i in row]
+                while header and header[-1] == "":
+                    header.pop()
+                all_columns = pd.Index(_header_names(header)).str.lower()
+                keep, predicates = _stream_projection(all_columns.tolist(), usecols, filters)
+                columns = all_columns[keep]
+                continue
+
+            # Checking the predicates before converting the rest of the row
+            width = len(row)
+            if not all(_convert_stream_cell(row[indx] if indx < width else None) in vals
+                       for indx, vals in predicates.items()):
+                continue
+            converted_row = [_convert_stream_cell(row[indx] if indx < width else None) for indx in keep]
+
+            # Empty rows are held back until the next row with data, so the trailing ones are never emitted
+            if all(i == "" for i in converted_row):
+                empty_rows.append(converted_row)
+                continue
+            data.extend(empty_rows)
+            empty_rows = []
+            data.append(converted_row)
+
+            if len(data) >= chunk_rows:
+                yield pd.DataFrame(data[: chunk_rows], columns=columns, dtype=object)
+                data = data[chunk_rows:]
+
+        if data:
+            yield pd.DataFrame(data, columns=columns, dtype=object)
+    finally:
+        workbook.close()
+
+
+def _read_xlsx_stream(xlsx_path: str,
+                      usecols: list[str] = None,
+                      filters: dict[str, str | list[str]] = None) -> pd.DataFrame:
+    """
+    Reads the first sheet of the xlsx file with a read-only openpyxl workbook taking raw values only. \n
+    Mimics pd.read_excel(na_filter=False, dtype=str): trailing empty rows are trimmed, empty headers are named
+    'Unnamed: N' and duplicated ones are mangled as 'name.N'. \n
+    If the columns or the predicates are set, the rows are parsed chunk by chunk with _iter_xlsx_stream(), so the
+    skipped cells are never converted
+    :param xlsx_path: path to the file
+    :param usecols: lowercased names of the columns to read. All columns by default
+    :param filters: row predicates as {column name: allowed value or list of values}
+    :return: read pd.DataFrame with the original headers (lowercased ones if the columns or the predicates are set)
+    """
+    if usecols is not None or filters:
+        chunks = list(_iter_xlsx_stream(xlsx_path, 50_000, usecols, filters))
+        if len(chunks) == 0:
+            return pd.DataFrame()
+        return pd.concat(chunks, axis=0, ignore_index=True)
+
+    workbook = openpyxl.load_workbook(xlsx_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+
+        header = None
+        data = []
+        last_row_with_data = -1
+        for row in sheet.iter_rows(values_only=True):
+            # Header keeps the values themselves, since pandas doesn't convert the column names
+            if header is None:
+                header = [_convert_header_cell(i) for i in row]
+                while header and header[-1] == "":
+                    header.pop()
+                continue
+
+            converted_row = [_convert_stream_cell(i) for i in row]
+            while converted_row and converted_row[-1] == "":
+                converted_row.pop()
+            if converted_row:
+                last_row_with_data = len(data)
+            data.append(converted_row)
+    finally:
+        workbook.close()
+
+    if header is None:
+        return pd.DataFrame()
+
+    # Trimming trailing empty rows and extending the rows to max width
+    data = data[: last_row_with_data + 1]
+    width = max([len(header)] + [len(i) for i in data])
+    header.extend([""] * (width - len(header)))
+    data = [i + [""] * (width - len(i)) for i in data]
+
+    return pd.DataFrame(data, columns=_header_names(header), dtype=object)
+
+
+def _read_table(xlsx_path: str,
+                engine: Literal["default", "openpyxl_stream", "calamine"] = "default",
+                usecols: list[str] = None,
+                filters: dict[str, str | list[str]] = None) -> pd.DataFrame:
+    """
+    Reads a single Excel file with the chosen engine. Engines fall back to the default one if they can't read the file
+    :param xlsx_path: path to the file
+    :param engine: Excel reading engine, see read_xlsx_files()
+    :param usecols: lowercased names of the columns to read. All columns by default
+    :param filters: row predicates as {column name: allowed value or list of values}
+    :return: read pd.DataFrame with lowercased headers
+    """
+    if engine == "openpyxl_stream" and not xlsx_path.lower().endswith(".xls"):
+        table = _read_xlsx_stream(xlsx_path, usecols, filters)
+        streamed = usecols is not None or bool(filters)
+    else:
+        # Columns needed for the predicates are read as well, they are dropped later
+        read_kwargs = {}
+        if usecols is not None:
+            wanted = {str(i).lower() for i in usecols} | set(_normalize_filters(filters) or {})
+            read_kwargs["usecols"] = lambda col: str(col).lower() in wanted
+        if engine == "calamine" and CALAMINE_SUPPORT:
+            read_kwargs["engine"] = "calamine"
+        table = pd.read_excel(xlsx_path, na_filter=False, dtype=str, **read_kwargs)
+        streamed = False
+
+    # Converting the headers to lowercase
+    table.columns = table.columns.str.lower()
+
+    if not streamed:
+        table = _apply_projection(table, usecols, filters)
+
+    return table
+
+
 def _write_sheets(table: pd.DataFrame | dict[pd.DataFrame] | dict[dict[pd.DataFrame]],
                   full_path: str,
                   index: bool = False) -> None:
@@ -3,9 +3,10 @@ A module contains merging functions for excel functions
 """
 import warnings
 from datetime import timedelta
+import numpy as np
 import pandas as pd
 from typing import Literal
-from excel_operations.excel_utils import transform_date
+from excel_operations.excel_utils import date_to_datetime
 from utils.utils import validate_arg_type
 from settings.defaults import GlobalDefaults, SystemDefaults, ResourcesDefaults
 
@@ -43,6 +44,368 @@ def concat_tables(tables: list[pd.DataFrame],
     return res
 
 
+def normalize_numeric_keys(values: pd.Series) -> pd.Series:
+    """
+    Strips numeric keys of leading zeros: '012345' -> '12345', '000' -> '0'. Numeric non-str values are converted to
+    str the same way, anything else is left as it is. Each unique value is processed once
+    :param values: source key column
+    :return: normalized key column with the same index
+    """
+    codes, uniques = pd.factorize(values.astype(object), use_na_sentinel=False)
+    uniques = pd.Series(uniques, dtype=object)
+    as_str = uniques.map(str)
+
+    res = uniques.copy()
+    is_numeric = as_str.str.isnumeric().to_numpy(dtype=bool)
+    is_digits = as_str.str.fullmatch(r"[0-9]+").to_numpy(dtype=bool)
+    digits = as_str[is_numeric & is_digits]
+    res.loc[digits.index] = digits.str.lstrip("0").replace("", "0")
+
+    # Other numeric symbols (e.g., non-ASCII digits) are converted one by one, if it's possible
+    for indx in as_str.index[is_numeric & ~is_digits]:
+        try:
+            res.loc[indx] = str(int(as_str[indx]))
+        except ValueError as err:
+            pass
+
+    return pd.Series(res.to_numpy(dtype=object)[codes], index=values.index, name=values.name, dtype=object)
+
+
+class LookupIndex:
+    """
+    Pre-hashed key columns of a reference table for repeated left lookups: source keys are matched with
+    pd.Index.get_indexer() and the reference columns are taken by the found positions, so neither table is copied. \n
+    Indexes are not cached: to hash a reference table once for several lookups, form the index and pass it to
+    enrich() or merge_with_table()
+    """
+    def __init__(self, table: pd.DataFrame, key_names: list[str] | str, is_numeric: bool = False):
+        """
+        Hashes the key columns of the table
+        :param table: reference table
+        :param key_names: name of the key field(s)
+        :param is_numeric: flag indicating whether the keys are normalized with normalize_numeric_keys() or not
+        """
+        self.table = table
+        self.key_names = validate_arg_type(key_names)
+        self.is_numeric = is_numeric
+        self.shape = table.shape
+        # Normalized keys are kept, so they might be reused without repeating the normalization
+        self.keys = self.form_keys(table, self.key_names, is_numeric)
+        self.index = self._form_index(self.keys)
+        self.is_unique = self.index.is_unique
+
+    @staticmethod
+    def form_keys(table: pd.DataFrame, key_names: list[str], is_numeric: bool = False) -> dict[str, np.ndarray]:
+        """
+        Forms the key columns for matching. Keys are compared as objects, so any key dtypes might be matched
+        :param table: source table
+        :param key_names: name of the key field(s)
+        :param is_numeric: flag indicating whether the keys are normalized with normalize_numeric_keys() or not
+        :return: dictionary {key name: key values}
+        """
+        if is_numeric:
+            return {key: normalize_numeric_keys(table[key]).to_numpy(dtype=object) for key in key_names}
+
+        return {key: table[key].to_numpy(dtype=object) for key in key_names}
+
+    @staticmethod
+    def _form_index(keys: dict[str, np.ndarray]) -> pd.Index:
+        """
+        Forms an index of the key columns
+        :param keys: dictionary {key name: key values}
+        :return: pd.Index for a single key, pd.MultiIndex otherwise
+        """
+        if len(keys) == 1:
+            return pd.Index(next(iter(keys.values())), dtype=object, tupleize_cols=False)
+
+        return pd.MultiIndex.from_arrays(list(keys.values()))
+
+    def is_valid_for(self, table: pd.DataFrame, key_names: list[str] | str = None, is_numeric: bool = None) -> bool:
+        """
+        Checks whether the index was formed for this very table and keys. In-place changes of the key values are not
+        tracked, the index should be formed again after such changes
+        :param table: reference table
+        :param key_names: name of the key field(s). Not checked if not set
+        :param is_numeric: keys normalization flag. Not checked if not set
+        :return: True if the index might be used for the table
+        """
+        return (self.table is table and self.table.shape == self.shape and
+                (key_names is None or validate_arg_type(key_names) == self.key_names) and
+                (is_numeric is None or is_numeric == self.is_numeric))
+
+    def get_positions(self, source: pd.DataFrame | dict[str, np.ndarray], key_names: list[str] | str,
+                      first_match: bool = False) -> np.ndarray:
+        """
+        Finds the reference table rows for each source row
+        :param source: source table or its already formed keys (see form_keys())
+        :param key_names: name of the key field(s) in the source table
+        :param first_match: flag allowing non-unique reference keys: the first row of the same keys is matched then
+        :return: array of the reference table row positions, -1 for the rows with no match
+        :raises ValueError: if the reference keys are not unique and first_match is not set
+        """
+        if not self.is_unique and not first_match:
+            raise ValueError(f"Reference table keys {self.key_names} are not unique")
+
+        source_keys = source
+        if isinstance(source, pd.DataFrame):
+            source_keys = self.form_keys(source, validate_arg_type(key_names), self.is_numeric)
+        source_index = self._form_index(source_keys)
+
+        if self.is_unique:
+            return self.index.get_indexer(source_index)
+
+        # Only the first rows of the same keys are left
+        first_rows = np.flatnonzero(~self.index.duplicated(keep="first"))
+        positions = self.index[first_rows].get_indexer(source_index)
+        return np.where(positions >= 0, first_rows[positions], -1)
+
+    def take(self, col_name: str, positions: np.ndarray) -> pd.api.extensions.ExtensionArray | np.ndarray:
+        """
+        Takes the reference column values by the positions. Missing values (-1) are filled the same way pd.merge() does
+        :param col_name: reference column name
+        :param positions: row positions (see get_positions())
+        :return: column values
+        """
+        return pd.api.extensions.take(self.table[col_name].values, positions, allow_fill=True)
+
+
+def get_lookup_index(table: pd.DataFrame, key_names: list[str] | str, is_numeric: bool = False,
+                     lookup_index: LookupIndex = None) -> LookupIndex:
+    """
+    Returns the passed lookup index if it was formed for the table and keys, forms a new one otherwise
+    :param table: reference table
+    :param key_names: name of the key field(s)
+    :param is_numeric: flag indicating whether the keys are normalized with normalize_numeric_keys() or not
+    :param lookup_index: index to reuse, e.g. the one formed for the previous chunk
+    :return: LookupIndex
+    """
+    if lookup_index is not None:
+        if lookup_index.is_valid_for(table, key_names, is_numeric):
+            return lookup_index
+        warnings.warn(f"The lookup index wasn't formed for the reference table and keys {key_names}, forming a new one",
+                      category=UserWarning)
+
+    return LookupIndex(table, key_names, is_numeric)
+
+
+DEFAULT_SUFFIX = " (доп.)"
+
+
+def _parse_dates(table: pd.DataFrame, date_name: str) -> np.ndarray:
+    """
+    Parses the date column the way merge_with_table() does: the parsed date column is used if it's already in the
+    table, incorrect dates are NaT
+    :param table: source table
+    :param date_name: date column name
+    :return: datetime64[ns] array
+    """
+    if GlobalDefaults.parsed_date in table.columns:
+        return pd.to_datetime(table[GlobalDefaults.parsed_date], errors="coerce").to_numpy(dtype="datetime64[ns]")
+
+    # Each unique value is parsed once (the same way transform_date() does)
+    codes, uniques = pd.factorize(table[date_name].astype(object), use_na_sentinel=False)
+    parsed = pd.to_datetime(pd.Series(date_to_datetime(list(uniques)), dtype=object), errors="coerce")
+
+    return parsed.to_numpy(dtype="datetime64[ns]")[codes]
+
+
+def _group_codes(source_keys: dict[str, np.ndarray], target_keys: dict[str, np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Encodes the key combinations of both tables with the same integer codes
+    :param source_keys: source keys (see LookupIndex.form_keys())
+    :param target_keys: reference table keys (see LookupIndex.form_keys())
+    :return: source codes and reference table codes, -1 for the rows with empty keys
+    """
+    source_len = len(next(iter(source_keys.values())))
+    codes = np.zeros(source_len + len(next(iter(target_keys.values()))), dtype=np.int64)
+    for source_key, target_key in zip(source_keys.values(), target_keys.values()):
+        key_codes, uniques = pd.factorize(np.concatenate([source_key, target_key]))
+        # Combining with the previous keys and re-encoding, so the codes stay small; empty keys stay -1
+        combined = np.where((codes < 0) | (key_codes < 0), -1, codes * (len(uniques) + 1) + key_codes)
+        codes = np.where(combined < 0, -1, pd.factorize(combined)[0])
+
+    return codes[:source_len], codes[source_len:]
+
+
+def _asof_positions(source_keys: dict[str, np.ndarray],
+                    source_dates: np.ndarray,
+                    target_keys: dict[str, np.ndarray],
+                    target_dates: np.ndarray,
+                    tolerance: timedelta) -> np.ndarray:
+    """
+    Finds the reference table row with the same keys and the nearest date for each source row. \n
+    Only the reference keys and dates are sorted: each source row is binary searched within its keys group, the earlier
+    record is preferred on equal distances (as merge_asof(direction='nearest') does), the first reference table record
+    is used for the duplicated keys and dates
+    :param source_keys: source keys (see LookupIndex.form_keys())
+    :param source_dates: source dates, datetime64 array
+    :param target_keys: reference table keys (see LookupIndex.form_keys())
+    :param target_dates: reference table dates, datetime64 array
+    :param tolerance: max difference between the dates
+    :return: array of the reference table row positions in the source rows order, -1 for the rows with no match
+    """
+    res = np.full(len(source_dates), -1, dtype=np.int64)
+    source_groups, target_groups = _group_codes(source_keys, target_keys)
+    source_dates = source_dates.astype("datetime64[ns]")
+    target_dates = target_dates.astype("datetime64[ns]")
+
+    # Rows with no keys or dates can't be matched
+    source_rows = np.flatnonzero((source_groups >= 0) & ~np.isnat(source_dates))
+    target_rows = np.flatnonzero((target_groups >= 0) & ~np.isnat(target_dates))
+    if len(source_rows) == 0 or len(target_rows) == 0:
+        return res
+
+    # Dates are replaced with their ranks, so a group and a date fit into a single sortable int64
+    date_ranks = np.unique(np.concatenate([source_dates[source_rows], target_dates[target_rows]]),
+                           return_inverse=True)[1].astype(np.int64)
+    ranks_count = int(date_ranks.max()) + 1
+    source_order = source_groups[source_rows] * ranks_count + date_ranks[:len(source_rows)]
+    target_order = target_groups[target_rows] * ranks_count + date_ranks[len(source_rows):]
+
+    sort_indx = np.argsort(target_order, kind="stable")
+    target_rows, target_order = target_rows[sort_indx], target_order[sort_indx]
+    sorted_groups, sorted_dates = target_groups[target_rows], target_dates[target_rows]
+    groups, dates = source_groups[source_rows], source_dates[source_rows]
+
+    # The last record not later than the source date and the first record not earlier than it, within the same group
+    backward = np.searchsorted(target_order, source_order, side="right") - 1
+    forward = np.searchsorted(target_order, source_order, side="left")
+    backward_clipped = np.clip(backward, 0, len(target_rows) - 1)
+    # The first one of the records with the same keys and date
+    backward_clipped = np.searchsorted(target_order, target_order[backward_clipped], side="left")
+    forward_clipped = np.clip(forward, 0, len(target_rows) - 1)
+    has_backward = (backward >= 0) & (sorted_groups[backward_clipped] == groups)
+    has_forward = (forward < len(target_rows)) & (sorted_groups[forward_clipped] == groups)
+
+    backward_diff = dates - sorted_dates[backward_clipped]
+    forward_diff = sorted_dates[forward_clipped] - dates
+    use_forward = has_forward & (~has_backward | (forward_diff < backward_diff))
+    nearest = np.where(use_forward, forward_clipped, backward_clipped)
+    diff = np.where(use_forward, forward_diff, backward_diff)
+
+    matched = (has_backward | has_forward) & (diff <= np.timedelta64(abs(tolerance)))
+    res[source_rows[matched]] = target_rows[nearest[matched]]
+
+    return res
+
+
+def _take_values(lookup_index: LookupIndex, col: str, positions: np.ndarray, fill_value=None):
+    """
+    Takes the reference table column values for the found positions
+    :param lookup_index: reference table lookup index
+    :param col: column name
+    :param positions: reference table row positions, -1 for the rows with no match
+    :param fill_value: value for the empty ones (including the rows with no match). None means no filling
+    :return: column values
+    """
+    values = lookup_index.take(col, positions)
+    if fill_value is None:
+        return values
+
+    values = pd.Series(values, copy=False)
+    if isinstance(values.dtype, pd.CategoricalDtype) and fill_value not in values.cat.categories:
+        values = values.cat.add_categories(fill_value)
+
+    return values.fillna(fill_value).array
+
+
+def enrich(source: pd.DataFrame, specs: list[dict]) -> pd.DataFrame:
+    """
+    Adds columns from several reference tables at once. All the lookups are done against the source keys and the new
+    columns are attached with a single concatenation, the source row order and index are kept. \n
+    Each spec is a dictionary: \n
+    - table: reference table \n
+    - columns: column name(s) to add \n
+    - source_keys, target_keys: name of the key field(s) in the source and reference tables. Default are the garage number ones \n
+    - suffix: suffix for the new column names. Default is '' \n
+    - is_numeric: flag indicating whether the keys are numeric (see merge_with_table()). Default is False \n
+    - use_dates: flag indicating whether the nearest by date record is looked up (see merge_with_table()). Default is False \n
+    - source_date, target_date: names of the date fields. Default are the creation date and resources date ones \n
+    - timedelta: max difference between the dates. Default is 100 years \n
+    - fill_value: value for the rows with no match. Default is GlobalDefaults.na_val in dates mode, NaN otherwise \n
+    - index: LookupIndex of the reference table by the target keys to reuse. Default is a new one \n
+    Unlike merge_with_table(), a source row never gets multiplied: the first record is used for non-unique reference keys
+    :param source: source table
+    :param specs: list of the lookup specs
+    :return: enriched table, the source table if nothing was added
+    """
+    print("Initializing table enrichment...")
+
+    if source is None or source.empty:
+        print("The source table doesn't exist or is empty. No additions could be done")
+        return source
+
+    added: dict[str, pd.api.extensions.ExtensionArray | np.ndarray] = {}
+    source_columns = source.columns.tolist()
+
+    for spec in specs:
+        target = spec.get("table")
+        if target is None or target.empty:
+            print(f"The reference table doesn't exist or is empty. Skipping the lookup of {spec.get('columns')}")
+            continue
+
+        # Spec parsing
+        columns = [i.lower() for i in validate_arg_type(spec.get("columns"))]
+        source_keys = [i.lower() for i in validate_arg_type(spec.get("source_keys", str(SystemDefaults.garage_num)))]
+        target_keys = [i.lower() for i in validate_arg_type(spec.get("target_keys", str(ResourcesDefaults.garage_num)))]
+        suffix = spec.get("suffix", "")
+        is_numeric = spec.get("is_numeric", False)
+        use_dates = spec.get("use_dates", False)
+        fill_value = spec.get("fill_value", GlobalDefaults.na_val if use_dates else None)
+
+        # Spec validation
+        if not set(source_keys) <= set(source_columns) or not set(target_keys) <= set(target.columns.tolist()) or \
+                len(source_keys) != len(target_keys):
+            warnings.warn(f"Keys are not represented in the tables or their count doesn't match: {source_keys}, "
+                          f"{target_keys}. Skipping the lookup of {columns}", category=UserWarning)
+            continue
+        missing_columns = [i for i in columns if i not in target.columns]
+        if len(missing_columns) > 0:
+            warnings.warn(f"Not all the column names are represented in the reference table. "
+                          f"Missing columns: {missing_columns}", category=UserWarning)
+        columns = [i for i in columns if i not in missing_columns and i not in target_keys]
+
+        # Looking up the reference table rows
+        lookup_index = get_lookup_index(target, target_keys, is_numeric, spec.get("index"))
+        keys = LookupIndex.form_keys(source, source_keys, is_numeric)
+        if use_dates:
+            source_date = str(spec.get("source_date", SystemDefaults.creation_date)).lower()
+            target_date = str(spec.get("target_date", ResourcesDefaults.date)).lower()
+            if source_date not in source_columns or target_date not in target.columns:
+                warnings.warn(f"Date columns are not represented in the tables: {source_date}, {target_date}. "
+                              f"Skipping the lookup of {columns}", category=UserWarning)
+                continue
+            positions = _asof_positions(keys, _parse_dates(source, source_date), lookup_index.keys,
+                                        _parse_dates(target[[target_date]], target_date),
+                                        abs(spec.get("timedelta", timedelta(weeks=5200))))
+        else:
+            if not lookup_index.is_unique:
+                warnings.warn(f"Reference table keys {target_keys} are not unique, the first records are used",
+                              category=UserWarning)
+            positions = lookup_index.get_positions(keys, source_keys, first_match=True)
+
+        # Taking the values
+        for col in columns:
+            name = col + suffix
+            if name in source_columns or name in added:
+                warnings.warn(f"Column '{name}' is already in the table, forcing suffix", category=UserWarning)
+                name += DEFAULT_SUFFIX
+            if name in source_columns or name in added:
+                warnings.warn(f"Column '{name}' is already in the table, skipping it", category=UserWarning)
+                continue
+
+            added[name] = _take_values(lookup_index, col, positions, fill_value)
+
+    if len(added) == 0:
+        print("Nothing to add to the table")
+        return source
+
+    res = pd.concat([source, pd.DataFrame(added, index=source.index)], axis=1, copy=False)
+
+    print(f"Table enriched successfully: {len(added)} column(s) added")
+    return res
+
+
 def _parse_keys(col_names: list[str] | str,
                 source_header: list,
                 target_header: list,
@@ -137,13 +500,14 @@ def merge_with_table(col_names: list[str] | str,
                      target_date_name: str = None,
                      default_timedelta: timedelta = timedelta(weeks=5200),
                      add_suffix: bool = True,
-                     suffix: str = " (доп.)"
+                     suffix: str = " (доп.)",
+                     lookup_index: LookupIndex = None
                      ) -> pd.DataFrame:
     """
     Forms a DataFrame using the given one by merging it with columns with another one. \n
     Merged columns are always in alphabetical order. Merging is performed by one column as well as a list of columns. \n
     It's possible to apply a numeric conversion to keys using 'is_numeric' parameter - e.g., '012345' -> '12345' so numeric key strings will match each other better. Conversion is applied only wherever it's possible. \n
-    Additional date params allows to perform check if the records are within the given time interval. The record with the minimal timedelta is always preferred over other matches. Any records outside of the given timedelta will be considered as the ones with no matches.
+    Additional date params allows to perform check if the records are within the given time interval. The record with the minimal timedelta is always preferred over other matches. Any records outside of the given timedelta will be considered as the ones with no matches. The added columns are filled with the default empty value for the rows with no matches, the source rows order is kept.
 
     :param col_names: list of column names to add. Single column name is also viable. Passing 'all' will trigger merging with all columns
     :param source_table: the source table
@@ -157,6 +521,7 @@ def merge_with_table(col_names: list[str] | str,
     :param default_timedelta: default value for datetimes comparison. Difference exceeding this one is considered as no match found. Default is 100 years
     :param add_suffix: flag defining whether to modify column names of the formed DataFrame or not. Default is True
     :param suffix: string value for suffix to add. Default is ''
+    :param lookup_index: LookupIndex of the target table by the target keys to reuse. Default is a new one
 
     :return: merged table on success, the source table on a failed attempt
     """
@@ -217,19 +582,6 @@ def merge_with_table(col_names: list[str] | str,
         warnings.warn(err.__str__(), category=UserWarning)
         return source_table
 
-    # Leaving only columns we actually need
-    tmp_target = target_table[column_names].copy(deep=True)
-    tmp_source = source_table.copy(deep=True)
-
-    # Filtering target table, so we will look up for values which are in the source table
-    if is_numeric:
-        # Satisfies the is_numeric logic and stripping from non-significant symbols
-        tmp_target.loc[:, _target_key_names] = tmp_target.loc[:, _target_key_names].apply(
-            lambda x: str(int(x)) if str(x).isnumeric() else x, axis=0)
-        tmp_source.loc[:, _source_key_names] = tmp_source.loc[:, _source_key_names].apply(
-            lambda x: str(int(x)) if str(x).isnumeric() else x, axis=0)
-        print("Numeric conversion to tables' keys applied (where it was possible)")
-
     # Executes only if needed: adds a suffix to the new column names for pandas method
     if add_suffix and suffix != "":
         _suffix = suffix
@@ -247,30 +599,57 @@ def merge_with_table(col_names: list[str] | str,
             _suffix = merge_with_table.__annotations__[suffix].default
         suffixes = {"suffixes": (None, _suffix)}
 
-    _default_na_val = GlobalDefaults.na_val
-    _default_timedelta = abs(default_timedelta)
+    # Lookup modes: no copies, the reference table keys are hashed once. Date mode always goes here, simple lookup
+    # table mode - if the reference keys are unique
+    lookup_index = get_lookup_index(target_table, _target_key_names, is_numeric, lookup_index)
+    if use_dates or lookup_index.is_unique:
+        source_keys = LookupIndex.form_keys(source_table, validate_arg_type(_source_key_names), is_numeric)
+        # Using date comparison: only the closest one by date in a given time interval will be merged
+        if use_dates:
+            positions = _asof_positions(source_keys, _parse_dates(source_table, _source_date_name),
+                                        lookup_index.keys,
+                                        _parse_dates(target_table[[_target_date_name]], _target_date_name),
+                                        default_timedelta)
+        else:
+            positions = lookup_index.get_positions(source_keys, _source_key_names)
+        _column_names_unchanged.sort()
+        added = {i + _suffix: _take_values(lookup_index, i, positions, GlobalDefaults.na_val if use_dates else None)
+                 for i in _column_names_unchanged if i not in _target_key_names}
+
+        new_index = pd.RangeIndex(len(source_table.index))
+        res = pd.concat([source_table.set_axis(new_index, axis=0, copy=False),
+                         pd.DataFrame(added, index=new_index)], axis=1, copy=False)
+        # Source keys are the normalized ones in the result
+        if is_numeric:
+            for key, val in source_keys.items():
+                res[key] = val
+            print("Numeric conversion to tables' keys applied (where it was possible)")
+        print("Table merged successfully")
+        return res
 
-    # Simple lookup table mode
-    if not use_dates:
-        res = pd.merge(left=tmp_source, right=tmp_target, how="left", left_on=_source_key_names,
-                       right_on=_target_key_names, **suffixes)  # .fillna(_default_na_val)
-    # Using date comparison: only the closest one by date in a given time interval will be merged
-    else:
-        if GlobalDefaults.parsed_date not in tmp_source.keys():
-            tmp_source[GlobalDefaults.parsed_date] = transform_date(
-                tmp_source[_source_date_name].values.tolist())[GlobalDefaults.parsed_date]
-        if GlobalDefaults.parsed_date not in tmp_target.keys():
-            tmp_target[GlobalDefaults.parsed_date] = transform_date(
-                tmp_target[_target_date_name].values.tolist())[GlobalDefaults.parsed_date]
-
-        tmp_source[GlobalDefaults.parsed_date] = pd.to_datetime(tmp_source[GlobalDefaults.parsed_date], errors="coerce")
-        tmp_target[GlobalDefaults.parsed_date] = pd.to_datetime(tmp_target[GlobalDefaults.parsed_date], errors="coerce")
-
-        res = pd.merge_asof(left=tmp_source.sort_values(by=GlobalDefaults.parsed_date),
-                            right=tmp_target.sort_values(by=GlobalDefaults.parsed_date),
-                            on=GlobalDefaults.parsed_date, left_by=_source_key_names, right_by=_target_key_names,
-                            **suffixes, tolerance=_default_timedelta, allow_exact_matches=True,
-                            direction="nearest").fillna(_default_na_val)
+    # Leaving only columns we actually need
+    tmp_target = target_table[column_names].copy(deep=True)
+    tmp_source = source_table.copy(deep=True)
+
+    # Compacted tables (see excel_utils.compact_table()) might have different key dtypes, merging requires the same ones
+    for source_key, target_key in zip(validate_arg_type(_source_key_names), validate_arg_type(_target_key_names)):
+        if tmp_source[source_key].dtype != tmp_target[target_key].dtype:
+            tmp_source[source_key] = tmp_source[source_key].astype(object)
+            tmp_target[target_key] = tmp_target[target_key].astype(object)
+
+    # Filtering target table, so we will look up for values which are in the source table
+    if is_numeric:
+        # Satisfies the is_numeric logic and stripping from non-significant symbols. Reference keys are taken from
+        # the lookup index, so they are normalized once per run
+        for key, val in lookup_index.keys.items():
+            tmp_target[key] = val
+        for key in validate_arg_type(_source_key_names):
+            tmp_source[key] = normalize_numeric_keys(tmp_source[key])
+        print("Numeric conversion to tables' keys applied (where it was possible)")
+
+    # Simple lookup table mode with non-unique reference keys: source rows are multiplied by the matches
+    res = pd.merge(left=tmp_source, right=tmp_target, how="left", left_on=_source_key_names,
+                   right_on=_target_key_names, **suffixes)  # .fillna(_default_na_val)
 
     # Checking if we've succeeded
     if res is None:
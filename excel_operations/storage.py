@@ -0,0 +1,311 @@
+"""
+A module contains on-disk storage functions for parsed tables and a persistent cache for the read Excel files
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import warnings
+from typing import Literal
+
+import pandas as pd
+
+# Columnar formats are available only with pyarrow installed, pickle is used as a fallback otherwise
+try:
+    import pyarrow
+    import pyarrow.ipc
+    ARROW_SUPPORT = True
+except ImportError:
+    ARROW_SUPPORT = False
+
+DEFAULT_CACHE_SIZE_LIMIT = 2 * 1024 ** 3
+_EXTENSIONS = {"feather": ".feather", "parquet": ".parquet", "pickle": ".pkl"}
+_STORAGE_ERRORS = (ValueError, TypeError, NotImplementedError, OSError, pickle.PicklingError)
+
+
+def dump_table(table: pd.DataFrame,
+               base_path: str,
+               fmt: Literal["feather", "parquet", "pickle"] = "feather") -> str:
+    """
+    Writes a table to the disk atomically (a temporary file is renamed after the writing is done)
+    :param table: source table to write. Must have a default index and string column names for columnar formats
+    :param base_path: full path to the target file without extension
+    :param fmt: preferable storage format. Falls back to pickle if pyarrow is not installed
+    :return: full path to the written file
+    :raises ValueError: on unsupported format
+    """
+    if fmt not in _EXTENSIONS:
+        raise ValueError(f"Unsupported storage format: {fmt}")
+    if not ARROW_SUPPORT:
+        fmt = "pickle"
+
+    full_path = base_path + _EXTENSIONS[fmt]
+    tmp_path = f"{full_path}.{os.getpid()}.tmp"
+    try:
+        if fmt == "feather":
+            table.to_feather(tmp_path)
+        elif fmt == "parquet":
+            table.to_parquet(tmp_path, index=False)
+        else:
+            table.to_pickle(tmp_path)
+        os.replace(tmp_path, full_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return full_path
+
+
+def load_table(full_path: str) -> pd.DataFrame:
+    """
+    Reads a table written by dump_table(). The format is defined by the file extension
+    :param full_path: full path to the file (including extension)
+    :return: read pd.DataFrame
+    :raises ValueError: on unsupported extension
+    """
+    if full_path.endswith(_EXTENSIONS["feather"]):
+        return pd.read_feather(full_path)
+    if full_path.endswith(_EXTENSIONS["parquet"]):
+        return pd.read_parquet(full_path)
+    if full_path.endswith(_EXTENSIONS["pickle"]):
+        return pd.read_pickle(full_path)
+
+    raise ValueError(f"Unsupported file extension: {full_path}")
+
+
+def dump_ipc(table: pd.DataFrame, full_path: str) -> int:
+    """
+    Writes a table to an uncompressed Arrow IPC file, so it might be read back without any deserialization
+    :param table: source table to write. Must have string column names
+    :param full_path: full path to the target file (including file name and extension)
+    :return: number of bytes written
+    :raises ImportError: if pyarrow is not installed
+    """
+    if not ARROW_SUPPORT:
+        raise ImportError("pyarrow is required for Arrow IPC files")
+
+    arrow_table = pyarrow.Table.from_pandas(table, preserve_index=False)
+    with pyarrow.OSFile(full_path, "wb") as sink:
+        with pyarrow.ipc.new_file(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+
+    return os.path.getsize(full_path)
+
+
+def load_ipc(full_path: str) -> pd.DataFrame:
+    """
+    Reads a table written by dump_ipc(). The file is memory-mapped and string columns are kept in Arrow buffers
+    (string[pyarrow] dtype), so they are neither copied nor converted to Python objects. Such a file must not be
+    changed while the table is in use (and can't be deleted on Windows till then)
+    :param full_path: full path to the file
+    :return: read pd.DataFrame
+    :raises ImportError: if pyarrow is not installed
+    """
+    if not ARROW_SUPPORT:
+        raise ImportError("pyarrow is required for Arrow IPC files")
+
+    with pyarrow.memory_map(full_path, "r") as source:
+        arrow_table = pyarrow.ipc.open_file(source).read_all()
+    string_types = {pyarrow.string(): pd.StringDtype("pyarrow"), pyarrow.large_string(): pd.StringDtype("pyarrow")}
+
+    return arrow_table.to_pandas(types_mapper=string_types.get)
+
+
+def file_hash(full_path: str, block_size: int = 1024 ** 2) -> str:
+    """
+    Calculates a content hash of the file
+    :param full_path: full path to the file
+    :param block_size: reading block size in bytes
+    :return: hex digest of the file content
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(full_path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+class XlsxCache:
+    """
+    Persistent cache for parsed Excel files. \n
+    Entries are looked up by absolute path, size and modification time of the source file. On a miss the content hash
+    is checked as well, so a copied or re-saved file with the same content is still a hit. Parsed tables are stored
+    in a columnar format, the least recently used ones are evicted once the size limit is exceeded
+    """
+
+    def __init__(self,
+                 cache_dir: str,
+                 size_limit: int = DEFAULT_CACHE_SIZE_LIMIT,
+                 fmt: Literal["feather", "parquet", "pickle"] = "feather"):
+        """
+        :param cache_dir: cache folder. Created if it doesn't exist
+        :param size_limit: max total size of the stored tables in bytes
+        :param fmt: storage format of the tables
+        """
+        self.cache_dir = cache_dir
+        self.size_limit = abs(size_limit)
+        self.fmt = fmt if ARROW_SUPPORT else "pickle"
+        self._index_dir = os.path.join(cache_dir, "index")
+        self._data_dir = os.path.join(cache_dir, "data")
+        self._content_hashes: dict[str, str] = {}
+
+        os.makedirs(self._index_dir, exist_ok=True)
+        os.makedirs(self._data_dir, exist_ok=True)
+
+    @staticmethod
+    def _entry_key(full_path: str, variant: str = "") -> str:
+        """
+        Forms a cache key based on the file's absolute path, size and modification time
+        :param full_path: path to the source file
+        :param variant: additional key part for the different reading options of the same file
+        :return: hex digest key
+        """
+        abs_path = os.path.abspath(full_path)
+        stat = os.stat(abs_path)
+        raw_key = f"{abs_path}|{stat.st_size}|{stat.st_mtime_ns}|{variant}"
+
+        return hashlib.sha1(raw_key.encode("utf-8")).hexdigest()
+
+    def _data_path(self, content_hash: str, variant: str = "") -> str:
+        """
+        Forms a path (without extension) for the table based on its source file's content
+        :param content_hash: content hash of the source file
+        :param variant: additional key part for the different reading options of the same file
+        :return: path to the table without extension
+        """
+        name = content_hash
+        if variant != "":
+            name += "_" + hashlib.sha1(variant.encode("utf-8")).hexdigest()[:12]
+
+        return os.path.join(self._data_dir, name)
+
+    def _try_load(self, data_path: str) -> pd.DataFrame | None:
+        """
+        Loads the stored table and marks it as recently used
+        :param data_path: full path to the stored table
+        :return: pd.DataFrame on success, None otherwise
+        """
+        try:
+            table = load_table(data_path)
+            os.utime(data_path)
+            return table
+        except _STORAGE_ERRORS as err:
+            return None
+
+    def _write_entry(self, key: str, data_path: str) -> None:
+        """
+        Writes an index entry linking a cache key with the stored table
+        :param key: cache key
+        :param data_path: full path to the stored table
+        :return: None
+        """
+        entry_path = os.path.join(self._index_dir, key + ".json")
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(tmp_path, mode="w", encoding="utf-8") as file:
+            json.dump({"data": os.path.basename(data_path)}, file)
+        os.replace(tmp_path, entry_path)
+
+    def get(self, full_path: str, variant: str = "") -> pd.DataFrame | None:
+        """
+        Looks up for a parsed table of the source file
+        :param full_path: path to the source file
+        :param variant: additional key part for the different reading options of the same file
+        :return: pd.DataFrame on a hit, None otherwise
+        """
+        try:
+            key = self._entry_key(full_path, variant)
+        except OSError as err:
+            return None
+
+        # Fast path: the file itself hasn't changed
+        entry_path = os.path.join(self._index_dir, key + ".json")
+        if os.path.isfile(entry_path):
+            try:
+                with open(entry_path, mode="r", encoding="utf-8") as file:
+                    data_name = json.load(file)["data"]
+                table = self._try_load(os.path.join(self._data_dir, data_name))
+                if table is not None:
+                    return table
+            except (OSError, KeyError, json.JSONDecodeError) as err:
+                pass
+
+        # Slow path: the file was touched or copied, but its content might be the same
+        try:
+            content_hash = file_hash(full_path)
+        except OSError as err:
+            return None
+        self._content_hashes[os.path.abspath(full_path)] = content_hash
+
+        data_path = self._data_path(content_hash, variant) + _EXTENSIONS[self.fmt]
+        if not os.path.isfile(data_path):
+            return None
+        table = self._try_load(data_path)
+        if table is not None:
+            self._write_entry(key, data_path)
+
+        return table
+
+    def put(self, full_path: str, table: pd.DataFrame, variant: str = "") -> bool:
+        """
+        Stores a parsed table of the source file
+        :param full_path: path to the source file
+        :param table: parsed table
+        :param variant: additional key part for the different reading options of the same file
+        :return: True on success, False otherwise
+        """
+        try:
+            key = self._entry_key(full_path, variant)
+            content_hash = self._content_hashes.pop(os.path.abspath(full_path), None)
+            if content_hash is None:
+                content_hash = file_hash(full_path)
+            data_path = dump_table(table, self._data_path(content_hash, variant), self.fmt)
+            self._write_entry(key, data_path)
+        except _STORAGE_ERRORS as err:
+            warnings.warn(f"Unable to cache the table read from {full_path}: {err.__str__()}")
+            return False
+
+        return True
+
+    def evict(self) -> int:
+        """
+        Removes the least recently used tables until the cache fits the size limit. Drops dangling index entries
+        :return: number of bytes freed
+        """
+        data_files = []
+        for name in os.listdir(self._data_dir):
+            path = os.path.join(self._data_dir, name)
+            if name.endswith(".tmp") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            data_files.append((stat.st_mtime, stat.st_size, path))
+
+        # The oldest access time goes first
+        data_files.sort()
+        total_size = sum(i[1] for i in data_files)
+        freed = 0
+        for _, size, path in data_files:
+            if total_size - freed <= self.size_limit:
+                break
+            try:
+                os.remove(path)
+                freed += size
+            except OSError as err:
+                continue
+
+        # Index entries pointing to the removed tables are useless
+        if freed > 0:
+            existing = set(os.listdir(self._data_dir))
+            for name in os.listdir(self._index_dir):
+                entry_path = os.path.join(self._index_dir, name)
+                try:
+                    with open(entry_path, mode="r", encoding="utf-8") as file:
+                        if json.load(file)["data"] in existing:
+                            continue
+                    os.remove(entry_path)
+                except (OSError, KeyError, json.JSONDecodeError) as err:
+                    continue
+            print(f"Reading cache: {freed} bytes evicted")
+
+        return freed
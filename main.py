@@ -1,3 +1,5 @@
+import os
+import sys
 from workflow.resources_addition import *
 from workflow.another_system_addition import SystemAddition
 import excel_operations.io as io
@@ -5,10 +7,11 @@ from excel_operations.merger import concat_tables, merge_with_table
 from datetime import timedelta
 from settings.defaults import GlobalDefaults, SystemDefaults, ResourcesDefaults, ClassifierDefaults, BranchesDefaults, load_settings
 from workflow.another_system_reports import Pivots
+from workflow.ingestion import read_partitioned, PARTITIONS, UNKNOWN_PARTITION
+from workflow.production import Production
 
 
 # TODO: logging, clean up the output
-# TODO: unify reading (so the script might read all files at once and only after split them by partitions)
 
 if __name__ == "__main__":
     # Loading settings
@@ -18,4 +21,23 @@ if __name__ == "__main__":
     print("All settings loaded successfully")
     tmp = ClassifierDefaults.table
 
-    # Some code here
+    # All the files are read at once and split by their types. The source folder is the current one or the one passed
+    # as an argument, its subfolders named after the table types (e.g., 'tasks', 'checks') are used as type hints
+    root = sys.argv[1] if len(sys.argv) > 1 else os.getcwd()
+    sources = {UNKNOWN_PARTITION: root}
+    sources.update({key: os.path.join(root, key) for key in PARTITIONS if os.path.isdir(os.path.join(root, key))})
+    tables = read_partitioned(sources)
+
+    # Production reports, one for each production file
+    for indx, table in enumerate(tables["production"]):
+        production = Production(fname=f"Выработка {indx + 1}" if len(tables["production"]) > 1 else "Выработка")
+        production.source = table
+        production.process_prod()
+
+    # System pivots
+    if len(tables["tasks"]) > 0 and len(tables["checks"]) > 0:
+        tasks = SystemAddition(concat_tables(tables["tasks"], axis="v", drop_indices=True), file_type="tasks").table
+        checks = SystemAddition(concat_tables(tables["checks"], axis="v", drop_indices=True), file_type="checks").table
+        io.form_new_xlsx(Pivots(tasks, checks).table, file_name="Свод")
+    else:
+        print("No tasks or checks tables found. Skipping the pivots...")
@@ -4,6 +4,34 @@ import os
 from typing import Any
 import pandas as pd
 
+# System tables filters (see excel_operations.filter_plan.FilterPlan for the predicate format). The columns are set by
+# the names of SystemAddition.filter_tasks()/filter_checks() column arguments. The values are set either as is
+# ('values') or by the SystemDefaults field name ('setting'), the latter are lowercased unless 'lower' is False
+DEFAULT_TASKS_FILTER = [
+    {"name": "observation", "column": "observation", "op": "match", "setting": "observation_filter", "lower": False},
+    {"name": "place", "column": "place", "op": "eq", "values": "", "lower": False},
+    {"name": "check kind", "column": "check_kind", "op": "eq", "setting": "allowed_check_kind", "empty": "allow"},
+    {"name": "direction", "column": "direction", "op": "eq", "setting": "direction_out"},
+    {"name": "task header", "column": "task_header", "op": "match", "setting": "forbidden_header_vals",
+     "negate": True},
+    {"name": "park", "column": "park", "op": "match", "setting": "forbidden_parks", "negate": True, "empty": "forbid"},
+    {"name": "stages", "column": "stages", "op": "isin", "setting": "allowed_stages"},
+    {"name": "priority", "column": "priority", "op": "isin", "setting": "tasks_allowed_priority"},
+]
+DEFAULT_CHECKS_FILTER = [
+    {"name": "observation", "column": "observation", "op": "eq", "setting": "allowed_check_kind"},
+    {"name": "check type", "column": "check_type", "op": "eq", "setting": "allowed_check_type"},
+    {"name": "appointed to", "column": "appointed_to", "op": "eq", "setting": "appointed_to_check_vals",
+     "empty": "allow"},
+    {"name": "task header", "column": "task_header", "op": "match", "setting": "forbidden_header_vals",
+     "negate": True},
+    {"name": "park", "column": "park", "op": "match", "setting": "forbidden_parks", "negate": True, "empty": "forbid"},
+    {"name": "direction", "column": "direction", "op": "eq", "setting": "direction_out"},
+    {"name": "check kind", "column": "check_kind", "op": "eq", "setting": "allowed_check_kind", "empty": "allow"},
+    {"name": "priority", "column": "priority", "op": "eq", "setting": "checks_allowed_priority"},
+    {"name": "stages", "column": "stages", "op": "isin", "setting": "forbidden_stages", "negate": True},
+]
+
 
 class GlobalDefaults:
     config = "global.json"
@@ -68,6 +96,8 @@ class SystemDefaults:
     appointed_to_check_vals: Any = None
     forbidden_header_vals: Any = None
     forbidden_parks: Any = None
+    tasks_filter: Any = DEFAULT_TASKS_FILTER
+    checks_filter: Any = DEFAULT_CHECKS_FILTER
 
     def __init__(self):
         pass
@@ -233,6 +263,9 @@ def _load_system() -> bool:
         SystemDefaults.appointed_to_check_vals = system_defaults["appointed_to_check_vals"]
         SystemDefaults.forbidden_header_vals = system_defaults["forbidden_header_vals"]
         SystemDefaults.forbidden_parks = system_defaults["forbidden_parks"]
+        # Optional ones, the configs without the filters keep working
+        SystemDefaults.tasks_filter = system_defaults.get("tasks_filter", DEFAULT_TASKS_FILTER)
+        SystemDefaults.checks_filter = system_defaults.get("checks_filter", DEFAULT_CHECKS_FILTER)
 
     except KeyError as err:
         print(f"Some parameters are missing in {SystemDefaults.config} config. Please, verify config file and try again")
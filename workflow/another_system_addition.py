@@ -3,12 +3,14 @@ A module contains classes which performs basic parsing of the System table and a
 """
 import warnings
 
+import numpy as np
 import pandas as pd
 import re
-from excel_operations.merger import concat_tables, merge_with_table
+from excel_operations.merger import concat_tables, enrich, LookupIndex
 from excel_operations.excel_utils import transform_date, get_garage_num
+from excel_operations.filter_plan import FilterPlan
 from settings.defaults import SystemDefaults, GlobalDefaults, ClassifierDefaults, BranchesDefaults
-from typing import Literal
+from typing import Literal, Iterable
 
 
 # TODO: add None checks for methods that includes None as a default value
@@ -16,6 +18,8 @@ class SystemAddition:
     """
     Class forms a pd.DataFrame based on parametric columns and masks assuming the table's type is type
     """
+    # Compiled filter plans shared between the instances, so the predicates stats are collected over all the tables
+    _filter_plans: dict[str, FilterPlan] = {}
 
     def __init__(self,
                  source: pd.DataFrame,
@@ -34,7 +38,8 @@ class SystemAddition:
                  date_pattern: str = None,
                  enable_filter: bool = True,
                  file_type: Literal["tasks", "checks"] = "tasks",
-                 include_fire_extinguishers: bool = False):
+                 include_fire_extinguishers: bool = False,
+                 lookup_indexes: dict[str, LookupIndex] = None):
         """
         Forms a pd.DataFrame based on parsed values
         :param source: the source table
@@ -54,6 +59,8 @@ class SystemAddition:
         :param enable_filter: a flag indicating whether to filter the source table or not
         :param file_type: file type to parse
         :param include_fire_extinguishers: flag indicating whether to include the associated division or not
+        :param lookup_indexes: classifier and branches tables indexes to reuse (see form_lookup_indexes()). Formed for each
+        table by default
         :return: a new pd.DataFrame with the targeted values
         """
         # Source table emptiness check
@@ -135,18 +142,19 @@ class SystemAddition:
             additional_table.drop(columns=list(diff), inplace=True)
         self.table = concat_tables([source, additional_table], axis="h", drop_indices=True)
 
-        # Additional columns from classifier
+        # Additional columns from classifier (tasks only) and branches table, both lookups are done in a single pass
+        _lookup_indexes = lookup_indexes or {}
+        specs = []
         if file_type == "tasks":
-            self.table = merge_with_table(col_names=[ClassifierDefaults.new_task, ClassifierDefaults.system],
-                                          source_table=self.table, target_table=ClassifierDefaults.table,
-                                          source_key_names=_observation,
-                                          target_key_names=ClassifierDefaults.task, add_suffix=False)
-
-        # Additional columns from branches table
-        self.table = merge_with_table(col_names=[BranchesDefaults.branch, BranchesDefaults.park_name],
-                                      source_table=self.table, target_table=BranchesDefaults.table,
-                                      source_key_names=_park,
-                                      target_key_names=BranchesDefaults.old_park_name, add_suffix=False)
+            specs.append({"table": ClassifierDefaults.table,
+                          "columns": sorted([ClassifierDefaults.new_task.lower(), ClassifierDefaults.system.lower()]),
+                          "source_keys": _observation, "target_keys": ClassifierDefaults.task,
+                          "index": _lookup_indexes.get("classifier")})
+        specs.append({"table": BranchesDefaults.table,
+                      "columns": sorted([BranchesDefaults.branch.lower(), BranchesDefaults.park_name.lower()]),
+                      "source_keys": _park, "target_keys": BranchesDefaults.old_park_name,
+                      "index": _lookup_indexes.get("branches")})
+        self.table = enrich(self.table, specs)
 
         # Filtering if necessary
         _res_direction = SystemDefaults.res_direction
@@ -165,6 +173,24 @@ class SystemAddition:
 
         return
 
+    @staticmethod
+    def source_columns(file_type: Literal["tasks", "checks"] = "tasks") -> list[str]:
+        """
+        Lists the lowercased source columns needed for parsing, filtering and pivots, so the reading might skip the rest
+        (see io.read_xlsx_files() usecols parameter)
+        :param file_type: file type to parse
+        :return: list of column names
+        """
+        columns = [SystemDefaults.task_header, SystemDefaults.observation, SystemDefaults.creation_date,
+                   SystemDefaults.direction, SystemDefaults.park, SystemDefaults.check_kind, SystemDefaults.priority,
+                   SystemDefaults.stages, SystemDefaults.contract]
+        if file_type == "tasks":
+            columns.extend([SystemDefaults.place])
+        else:
+            columns.extend([SystemDefaults.appointed_to, SystemDefaults.check_type])
+
+        return [str(i).lower() for i in columns]
+
     @staticmethod
     def _form_garage_num(source_col: list[str]) -> list[str]:
         """
@@ -175,28 +201,45 @@ class SystemAddition:
         return get_garage_num(source_col)
 
     @staticmethod
-    def _form_prohibition(source_col: list, pattern: re.Pattern) -> list[str]:
+    def _classify_observations(source_col: list,
+                               pattern: re.Pattern | str,
+                               include_fire_extinguishers: bool = False) -> dict[str, list[str]]:
+        """
+        Forms all the observation-based columns in a single pass: the prohibition category and (if needed) the fire
+        extinguisher one. Each unique observation is classified once, the results are spread back to the rows
+        :param source_col: source observation column
+        :param pattern: compiled regex pattern for the prohibition matching
+        :param include_fire_extinguishers: flag indicating whether to form the fire extinguisher column or not
+        :return: dictionary {column name: column values}
+        """
+        codes, uniques = pd.factorize(pd.Series(source_col, dtype=object), use_na_sentinel=False)
+        uniques = pd.Series(uniques, dtype=object)
+
+        res = {SystemDefaults.prohibition_strict: SystemAddition._form_prohibition(uniques, pattern)}
+        if include_fire_extinguishers:
+            res[SystemDefaults.fire_ext] = SystemAddition._form_fire_ext(uniques)
+
+        return {key: val.to_numpy(dtype=object)[codes].tolist() for key, val in res.items()}
+
+    @staticmethod
+    def _form_prohibition(source_col: pd.Series, pattern: re.Pattern | str) -> pd.Series:
         """
         Forms the task categories (final version: used to avoid empty values)
         :param source_col: source task category column
         :param pattern: compiled regex pattern for matching
         :return: a column of the task categories without any empty values
         """
-        search_res = []
+        res = pd.Series(SystemDefaults.prohibition_all, index=source_col.index, dtype=object)
+        is_str = source_col.map(type) == str
 
-        for indx, row_elem in enumerate(source_col):
-            try:
-                tmp_res = re.findall(pattern, row_elem)
-            except ValueError as err:
-                search_res.append(row_elem)
-                continue
-            else:
-                if len(tmp_res) > 0:
-                    search_res.append(SystemDefaults.prohibition_strict)
-                else:
-                    search_res.append(SystemDefaults.prohibition_all)
+        matched = source_col[is_str].str.contains(pattern, regex=True).astype(bool)
+        res.loc[matched.index[matched]] = SystemDefaults.prohibition_strict
+        # Non-str values are matched as they are
+        for indx in source_col.index[~is_str]:
+            if len(re.findall(pattern, source_col[indx])) > 0:
+                res.loc[indx] = SystemDefaults.prohibition_strict
 
-        return search_res
+        return res
 
     @staticmethod
     def _form_dates(source_col: list[str], date_pattern: str = None) -> pd.DataFrame:
@@ -214,41 +257,56 @@ class SystemAddition:
                               week=True)
 
     @staticmethod
-    def _form_direction(source_direction: list[str], source_hour: list[str]) -> list[str]:
+    def _form_direction(source_direction: list[str], source_hour: np.ndarray) -> list[str]:
         """
         Forms a column with the final version of a vehicle direction value. If the source value is empty
         then during a time period between 4:00 and 12:59 we suppose that the direction is SystemDefaults.direction_out
         :param source_direction: source direction column for parsing
-        :param source_hour: source hour column for parsing
+        :param source_hour: source hour column for parsing (int array, e.g. from _get_hours())
         :return: a list with the final version of the target value
         """
-        res = []
-        source = [str(i) for i in source_direction]
+        source = np.array(source_direction, dtype=object)
+        if pd.api.types.infer_dtype(source, skipna=False) not in ("string", "empty"):
+            source = pd.Series(source, dtype=object).astype(str).to_numpy(dtype=object)
+        hours = np.asarray(source_hour).astype(int)
 
-        for direction, hour in zip(source, source_hour):
-            if len(direction) > 0:
-                res.append(direction)
-            else:
-                if int(hour) in range(4, 13):
-                    res.append(SystemDefaults.direction_out)
-                else:
-                    res.append(SystemDefaults.direction_in)
+        # Empty directions are replaced based on the hour: [direction_in, direction_out][is_day]
+        fallback = np.array([SystemDefaults.direction_in, SystemDefaults.direction_out],
+                            dtype=object)[((hours >= 4) & (hours <= 12)).astype(int)]
 
-        return res
+        return np.where(source == "", fallback, source).tolist()
 
     @staticmethod
-    def _form_fire_ext(prohibition):
+    def _get_hours(parsed_dates: pd.Series) -> np.ndarray:
+        """
+        Gets the hours of the parsed dates (see transform_date()) without any string conversions
+        :param parsed_dates: parsed dates column, datetime64 or datetime objects
+        :return: int array of hours
+        """
+        return parsed_dates.astype("datetime64[us]").dt.hour.to_numpy(dtype=int)
+
+    @staticmethod
+    def _form_fire_ext(prohibition: pd.Series) -> pd.Series:
         """
         Forms an additional column for a desired task. Parses the source column in attempt to find one of the 2 keywords
         :param prohibition: source column
         :return: additional column
         """
-        res = [SystemDefaults.fire_ext_na] * len(prohibition)
-        for i in range(len(prohibition)):
-            if SystemDefaults.fire_ext_add_key in prohibition[i]:
-                res[i] = SystemDefaults.fire_ext_add
-            elif SystemDefaults.fire_ext_main_key in prohibition[i]:
-                res[i] = SystemDefaults.fire_ext_main
+        res = pd.Series(SystemDefaults.fire_ext_na, index=prohibition.index, dtype=object)
+        is_str = prohibition.map(type) == str
+        str_vals = prohibition[is_str]
+
+        # The additional key is preferred over the main one
+        is_main = str_vals.str.contains(SystemDefaults.fire_ext_main_key, regex=False).astype(bool)
+        is_add = str_vals.str.contains(SystemDefaults.fire_ext_add_key, regex=False).astype(bool)
+        res.loc[is_main.index[is_main]] = SystemDefaults.fire_ext_main
+        res.loc[is_add.index[is_add]] = SystemDefaults.fire_ext_add
+        # Non-str values are checked as they are
+        for indx in prohibition.index[~is_str]:
+            if SystemDefaults.fire_ext_add_key in prohibition[indx]:
+                res.loc[indx] = SystemDefaults.fire_ext_add
+            elif SystemDefaults.fire_ext_main_key in prohibition[indx]:
+                res.loc[indx] = SystemDefaults.fire_ext_main
 
         return res
 
@@ -289,33 +347,12 @@ class SystemAddition:
                 f"No filtering for tasks table will be done")
             return source
 
-        # Preparing variables and conditions
-        observation_filter = SystemDefaults.observation_filter
-        forbidden_header_vals = str(SystemDefaults.forbidden_header_vals).lower()
-        allowed_direction = str(SystemDefaults.direction_out).lower()
-        forbidden_parks = str(SystemDefaults.forbidden_parks).lower()
-        allowed_stages = [elem.lower() for elem in SystemDefaults.allowed_stages]
-        allowed_check_kind = str(SystemDefaults.allowed_check_kind).lower()
-        allowed_priority = [elem.lower() for elem in SystemDefaults.tasks_allowed_priority]
-
-        place_condition = source[_place] == ""
-        check_kind_condition = ((source[_check_kind].apply(lambda x: str(x).lower()) == allowed_check_kind) |
-                                (source[_check_kind] == ""))
-        park_condition = ~(source[_park].apply(lambda x: str(x).lower()).str.match(forbidden_parks) |
-                           (source[_park] == ""))
-        header_condition = ~(source[_task_header].apply(lambda x: str(x).lower()).str.match(forbidden_header_vals))
-        observation_condition = source[_observation].str.match(observation_filter)
-        stages_condition = source[_stages].apply(lambda x: str(x).lower()).isin(allowed_stages)
-        priority_condition = source[_priority].apply(lambda x: str(x).lower()).isin(allowed_priority)
-        direction_condition = source[_direction].apply(lambda x: str(x).lower()) == allowed_direction
-
-        # Result condition
-        total_condition = \
-            observation_condition & place_condition & check_kind_condition & direction_condition & header_condition & \
-            park_condition & stages_condition & priority_condition
-
         # Filtering the table
-        res = source[total_condition]
+        plan = SystemAddition._get_filter_plan(
+            SystemAddition.tasks_filter_spec(_observation, _place, _check_kind, _direction, _park, _stages, _priority,
+                                             _task_header), "tasks")
+        res = source[plan.mask(source)]
+        plan.report()
 
         res.reset_index(drop=True, inplace=True)
 
@@ -369,58 +406,186 @@ class SystemAddition:
                           f"No filtering for checks table will be done")
             return source
 
-        # Filter params
-        appointed_to_check_vals = str(SystemDefaults.appointed_to_check_vals).lower()
-        forbidden_header_vals = str(SystemDefaults.forbidden_header_vals).lower()
-        forbidden_parks = str(SystemDefaults.forbidden_parks).lower()
-        allowed_direction = str(SystemDefaults.direction_out).lower()
-        allowed_check_kind = str(SystemDefaults.allowed_check_kind).lower()
-        allowed_check_type = str(SystemDefaults.allowed_check_type).lower()
-        allowed_priority = str(SystemDefaults.checks_allowed_priority).lower()
-        forbidden_stages = [elem.lower() for elem in SystemDefaults.forbidden_stages]
-
-        # Preparing conditions
-        # TODO: unify tasks and checks filtering as much as possible (seems not at least in appropriate way)
-        observation_condition = source[_observation].apply(lambda x: str(x).lower()) == allowed_check_kind
-        check_kind_condition = (source[_check_kind].apply(lambda x: str(x).lower()) == allowed_check_kind) | \
-                               (source[_check_kind] == "")
-        check_type_condition = source[_check_type].apply(lambda x: str(x).lower()) == allowed_check_type
-        priority_condition = source[_priority].apply(lambda x: str(x).lower()) == allowed_priority
-        appointed_condition = (source[_appointed_to].apply(lambda x: str(x).lower()) == appointed_to_check_vals) | \
-                              (source[_appointed_to] == "")
-        header_condition = ~(source[_task_header].apply(lambda x: str(x).lower()).str.match(forbidden_header_vals))
-        park_condition = ~(source[_park].apply(lambda x: str(x).lower()).str.match(forbidden_parks) |
-                           (source[_park] == ""))
-        direction_condition = source[_direction].apply(lambda x: str(x).lower()) == allowed_direction
-        stages_condition = ~(source[_stages].apply(lambda x: str(x).lower()).isin(forbidden_stages))
-
-        # Result condition
-        total_condition = \
-            observation_condition & check_type_condition & appointed_condition & header_condition & park_condition & \
-            direction_condition & check_kind_condition & priority_condition & stages_condition
-
         # Filtering the table
-        res = source[total_condition]
+        plan = SystemAddition._get_filter_plan(
+            SystemAddition.checks_filter_spec(_observation, _check_kind, _task_header, _appointed_to, _park,
+                                              _direction, _check_type, _priority, _stages), "checks")
+        res = source[plan.mask(source)]
+        plan.report()
+
+        # Dropping the same checks done during the day
+        res = SystemAddition._drop_check_duplicates(res, _creation_date, _task_header)
+
+        # Dealing with NaNs
+        res = res.dropna(subset=[_task_header])
+        res.fillna(GlobalDefaults.na_val, inplace=True)
+
+        res.reset_index(drop=True, inplace=True)
+
+        print("Checks table filtered successfully")
+        return res
+
+    @staticmethod
+    def _build_filter_spec(template: list[dict], columns: dict[str, str]) -> list[dict]:
+        """
+        Forms a filter spec from the settings template (see SystemDefaults.tasks_filter): the column keys are replaced
+        with the column names, the 'setting' keys with the lowercased (unless 'lower' is False) SystemDefaults values
+        :param template: list of predicates with the column keys
+        :param columns: dictionary {column key: column name}
+        :return: list of predicates (see FilterPlan for the spec format)
+        :raises ValueError: on unknown column key or setting
+        """
+        res = []
+        for item in template:
+            if item["column"] not in columns:
+                raise ValueError(f"Unknown filter column: {item['column']}. Supported ones: {list(columns.keys())}")
+            predicate = {key: val for key, val in item.items() if key != "setting"}
+            predicate["column"] = columns[item["column"]]
+
+            if "setting" in item:
+                if not hasattr(SystemDefaults, item["setting"]):
+                    raise ValueError(f"Unknown filter setting: {item['setting']}")
+                values = getattr(SystemDefaults, item["setting"])
+                if item.get("lower", True):
+                    values = [str(elem).lower() for elem in values] if isinstance(values, list) else str(values).lower()
+                predicate["values"] = values
+            res.append(predicate)
+
+        return res
+
+    @staticmethod
+    def tasks_filter_spec(observation: str, place: str, check_kind: str, direction: str, park: str, stages: str,
+                          priority: str, task_header: str) -> list[dict]:
+        """
+        Forms the tasks filter spec based on the SystemDefaults values (see SystemDefaults.tasks_filter)
+        :param observation: observation column name
+        :param place: place column name
+        :param check_kind: check type column name
+        :param direction: direction column name
+        :param park: park column name
+        :param stages: stages column name
+        :param priority: priority column name
+        :param task_header: task header column name
+        :return: list of predicates
+        """
+        return SystemAddition._build_filter_spec(
+            SystemDefaults.tasks_filter,
+            {"observation": observation, "place": place, "check_kind": check_kind, "direction": direction,
+             "park": park, "stages": stages, "priority": priority, "task_header": task_header})
+
+    @staticmethod
+    def checks_filter_spec(observation: str, check_kind: str, task_header: str, appointed_to: str, park: str,
+                           direction: str, check_type: str, priority: str, stages: str) -> list[dict]:
+        """
+        Forms the checks filter spec based on the SystemDefaults values (see SystemDefaults.checks_filter)
+        :param observation: observation column name
+        :param check_kind: check kind column name
+        :param task_header: task_header column name
+        :param appointed_to: appointed_to column name
+        :param park: park column name
+        :param direction: direction column name
+        :param check_type: check type column name
+        :param priority: priority column name
+        :param stages: stages column name
+        :return: list of predicates
+        """
+        return SystemAddition._build_filter_spec(
+            SystemDefaults.checks_filter,
+            {"observation": observation, "check_kind": check_kind, "task_header": task_header,
+             "appointed_to": appointed_to, "park": park, "direction": direction, "check_type": check_type,
+             "priority": priority, "stages": stages})
+
+    @staticmethod
+    def _get_filter_plan(spec: list[dict], name: str) -> FilterPlan:
+        """
+        Returns the compiled plan for the spec, compiling it only once
+        :param spec: filter spec
+        :param name: plan name for the report
+        :return: compiled plan
+        """
+        key = f"{name}: {spec!r}"
+        if key not in SystemAddition._filter_plans:
+            SystemAddition._filter_plans[key] = FilterPlan(spec, name)
+
+        return SystemAddition._filter_plans[key]
+
+    @staticmethod
+    def _drop_check_duplicates(source: pd.DataFrame, creation_date: str, task_header: str) -> pd.DataFrame:
+        """
+        Leaves only the earliest check for each task header and day. Auxiliary date columns are dropped afterwards
+        :param source: checks table
+        :param creation_date: creation date column name
+        :param task_header: task header column name
+        :return: pd.DataFrame without duplicates
+        """
+        res = source
 
         # Adding datetime column
         if GlobalDefaults.parsed_date not in res.columns.tolist():
-            res = concat_tables([res, transform_date(res[_creation_date].values.tolist(), SystemDefaults.datetime_format,
+            res = concat_tables([res, transform_date(res[creation_date].values.tolist(), SystemDefaults.datetime_format,
                                                      year=True, month=True, day=True)], axis="h", drop_indices=True)
         # Sort DataFrame by datetime column in ascending order
         res = res.sort_values(GlobalDefaults.parsed_date)
 
         # Drop duplicates based on 'Date' and 'task_header' columns
-        res = res.drop_duplicates(subset=[GlobalDefaults.day, GlobalDefaults.month, GlobalDefaults.year, _task_header])
+        res = res.drop_duplicates(subset=[GlobalDefaults.day, GlobalDefaults.month, GlobalDefaults.year, task_header])
 
-        # Dealing with NaNs and additional columns
-        res.drop(columns=[GlobalDefaults.parsed_date, GlobalDefaults.day, GlobalDefaults.month, GlobalDefaults.year],
-                 inplace=True)
-        res = res.dropna(subset=[_task_header])
-        res.fillna(GlobalDefaults.na_val, inplace=True)
+        # Dropping additional columns
+        res = res.drop(columns=[GlobalDefaults.parsed_date, GlobalDefaults.day, GlobalDefaults.month,
+                                GlobalDefaults.year])
 
-        res.reset_index(drop=True, inplace=True)
+        return res
+
+    @staticmethod
+    def form_lookup_indexes() -> dict[str, LookupIndex]:
+        """
+        Forms the classifier and branches tables indexes, so they might be hashed once for several tables
+        :return: dictionary {'classifier': LookupIndex, 'branches': LookupIndex}. Missing or empty tables are skipped
+        """
+        res = {}
+        for name, table, key in [("classifier", ClassifierDefaults.table, str(ClassifierDefaults.task).lower()),
+                                 ("branches", BranchesDefaults.table, str(BranchesDefaults.old_park_name).lower())]:
+            if table is not None and not table.empty and key in table.columns:
+                res[name] = LookupIndex(table, key)
+
+        return res
+
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[pd.DataFrame], **kwargs) -> "SystemAddition":
+        """
+        Forms the table chunk by chunk, so only a single raw chunk is kept in memory at once. \n
+        Each chunk is parsed and filtered separately, the results are concatenated. Checks duplicates are dropped once
+        again after the concatenation, since the same check might be split between chunks
+        :param chunks: iterable over the source table chunks, e.g. io.iter_xlsx_chunks()
+        :param kwargs: SystemAddition parameters except the source table
+        :return: SystemAddition object with the table formed from all the chunks
+        """
+        res = cls.__new__(cls)
+        res._cols_to_add = {}
+
+        # Reference tables are hashed once for all the chunks
+        if kwargs.get("lookup_indexes") is None:
+            kwargs["lookup_indexes"] = cls.form_lookup_indexes()
+
+        parts = []
+        for chunk in chunks:
+            part = cls(chunk, **kwargs).table
+            if part is not None and not part.empty:
+                parts.append(part)
+
+        if len(parts) == 0:
+            print("No chunks with data were processed")
+            res.table = None
+            return res
+        res.table = concat_tables(parts, axis="v", drop_indices=True)
+
+        # The same check might be split between chunks
+        if kwargs.get("file_type", "tasks") == "checks" and kwargs.get("enable_filter", True):
+            _creation_date = str(kwargs.get("creation_date") or SystemDefaults.creation_date).lower()
+            _task_header = str(kwargs.get("task_header") or SystemDefaults.task_header).lower()
+            res.table = cls._drop_check_duplicates(res.table, _creation_date, _task_header)
+            res.table.reset_index(drop=True, inplace=True)
 
-        print("Checks table filtered successfully")
         return res
 
     def form_cols(self,
@@ -449,14 +614,13 @@ class SystemAddition:
 
         # Adding base columns
         self._cols_to_add[SystemDefaults.garage_num] = self._form_garage_num(task_header)
-        self._cols_to_add[SystemDefaults.prohibition_strict] = self._form_prohibition(observation, observation_pattern)
-        if include_fire_extinguishers:
-            self._cols_to_add[SystemDefaults.fire_ext] = self._form_fire_ext(observation)
+        self._cols_to_add.update(self._classify_observations(observation, observation_pattern,
+                                                             include_fire_extinguishers))
 
         # Adding some dates
         dates_frame = self._form_dates(creation_date, _date_pattern)
         self._cols_to_add[SystemDefaults.res_direction] = \
-            self._form_direction(direction, dates_frame[GlobalDefaults.hour].values.tolist())
+            self._form_direction(direction, self._get_hours(dates_frame[GlobalDefaults.parsed_date]))
 
         # Finalizing the addition
         res = pd.DataFrame().from_dict(self._cols_to_add)
@@ -1,16 +1,74 @@
 """
 A module contains parsing methods for system tables which forms ready-to-use pivots
 """
+import multiprocessing
+import os
 import warnings
-
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Literal
 
 from settings.defaults import SystemDefaults, GlobalDefaults, ResourcesDefaults, BranchesDefaults, ClassifierDefaults
 import pandas as pd
-from excel_operations.merger import concat_tables
+from workflow.pivot_aggregates import GROUP, count_rows, main_pivot, parks_pivot, tasks_pivot, contract_top, \
+    group_modifications, find_modification
 
 # TODO: the latest changes need to be added via settings.defaults
 
+EXECUTION_MODES = ("sequential", "threads", "processes")
+
+# Sections being built by the forked workers: they are inherited by the workers (copy-on-write), so the source tables
+# are neither pickled nor copied
+_shared_sections: dict[str, tuple[Callable, tuple]] = {}
+
+
+def _run_shared_section(name: str) -> tuple[str, object]:
+    """
+    Builds a single section in a forked worker
+    :param name: section name
+    :return: section name and the section itself
+    """
+    func, args = _shared_sections[name]
+    return name, func(*args)
+
+
+def run_sections(sections: dict[str, tuple[Callable, tuple]],
+                 execution: Literal["sequential", "threads", "processes"] = "sequential",
+                 max_workers: int = None) -> dict[str, object]:
+    """
+    Builds independent report sections, concurrently if needed. The source tables must not be modified by the sections
+    :param sections: dictionary {section name: (function, its positional arguments)}
+    :param execution: 'sequential', 'threads' (a thread pool) or 'processes' (a pool of forked processes sharing the
+    source tables copy-on-write). Processes fall back to threads if fork is not available on the platform
+    :param max_workers: max number of workers. Default is the number of sections limited by the CPU count
+    :return: dictionary {section name: section} in the sections order
+    :raises ValueError: on unknown execution mode
+    """
+    global _shared_sections
+
+    if execution not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode: {execution}. Supported ones: {EXECUTION_MODES}")
+    if execution == "processes" and "fork" not in multiprocessing.get_all_start_methods():
+        warnings.warn("Fork start method is not available on the platform, threads are used instead")
+        execution = "threads"
+
+    n_workers = min(len(sections), max_workers or os.cpu_count() or 1)
+    if execution == "sequential" or n_workers < 2:
+        return {name: func(*args) for name, (func, args) in sections.items()}
+
+    if execution == "threads":
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            futures = {name: executor.submit(func, *args) for name, (func, args) in sections.items()}
+            return {name: future.result() for name, future in futures.items()}
+
+    _shared_sections = sections
+    try:
+        with multiprocessing.get_context("fork").Pool(processes=n_workers) as pool:
+            results = dict(pool.map(_run_shared_section, list(sections.keys()), chunksize=1))
+    finally:
+        _shared_sections = {}
+
+    return {name: results[name] for name in sections}
+
 
 class Pivots:
     def __init__(self,
@@ -25,6 +83,8 @@ class Pivots:
                  contract: str = None,
                  modification: str = None,
                  top_count: int = 5,
+                 execution: Literal["sequential", "threads", "processes"] = "sequential",
+                 max_workers: int = None
                  ):
         """
         Forms a pivot with branches indices and observations count (all and strict prohibitions separately) \n
@@ -33,6 +93,8 @@ class Pivots:
         :param checks_table: additional table needed for unit values calculation
         :param prohibition: prohibition column name
         :param branch: branch column name
+        :param execution: sections building mode: 'sequential', 'threads' or 'processes' (see run_sections())
+        :param max_workers: max number of workers for the concurrent modes
         :return: pd.DataFrame on success, None otherwise
         """
         self.table = None
@@ -124,18 +186,19 @@ class Pivots:
                 f"Some of the branches from the checks table are not present in the config: {diff}. No pivots will be done")
             return
 
-        parks_pivot = self._form_parks_pivot(tasks_table, checks_table, _park, _prohibition, _top_count)
-        parks_single_obs_pivot = self._form_parks_pivot(tasks_table[tasks_table[_observation] == _top_categories[0]],
-                                                        checks_table, _park, _prohibition, _top_count)
-        tasks_pivot = self._form_tasks_pivot(tasks_table, checks_table, _prohibition, _observation,
-                                             _detailed_observation, _branch, _top_count)
-        main_pivot = self._form_main_pivot(tasks_table, checks_table, _prohibition, _branch)
-
-        contract_top_pivot = self._form_contract_top(tasks_table, checks_table, _top_categories, _observation,
-                                             _contract, _branch, _modification)
-
-        self.table = {"Main pivot": main_pivot, "Top tasks": tasks_pivot, "Top parks": parks_pivot,
-                      "Top contract": contract_top_pivot, "Top parks by category": parks_single_obs_pivot}
+        # The sections are independent and read-only, so they might be built concurrently
+        sections = {
+            "Main pivot": (self._form_main_pivot, (tasks_table, checks_table, _prohibition, _branch)),
+            "Top tasks": (self._form_tasks_pivot, (tasks_table, checks_table, _prohibition, _observation,
+                                                   _detailed_observation, _branch, _top_count)),
+            "Top parks": (self._form_parks_pivot, (tasks_table, checks_table, _park, _prohibition, _top_count)),
+            "Top contract": (self._form_contract_top, (tasks_table, checks_table, _top_categories, _observation,
+                                                       _contract, _branch, _modification)),
+            "Top parks by category": (self._form_parks_pivot,
+                                      (tasks_table[tasks_table[_observation] == _top_categories[0]], checks_table,
+                                       _park, _prohibition, _top_count)),
+        }
+        self.table = run_sections(sections, execution, max_workers)
 
         pass
 
@@ -153,60 +216,9 @@ class Pivots:
         :param branch: branch column name
         :return: pd.DataFrame on success, None otherwise
         """
-        # Organizing pivot table's structure
-        branches = GlobalDefaults.branches + [GlobalDefaults.na_val, GlobalDefaults.pivot_name]
-        res = pd.DataFrame(columns=["prohibition", "tasks", "checks", "all rel", "prohib rel"], index=branches)
-
-        # Counting the required values
-        prohibition_counts = \
-            source_table[source_table[prohibition].apply(lambda x: str(x).lower()) == SystemDefaults.prohibition_strict][
-                branch].value_counts()
-        all_counts = source_table[branch].value_counts()
-        checks_counts = checks_table[branch].value_counts()
-
-        # Lowercasing indices
-        prohibition_counts.index = prohibition_counts.index.str.lower()
-        all_counts.index = all_counts.index.str.lower()
-        checks_counts.index = checks_counts.index.str.lower()
-
-        # Filling the pivot table with the source data (without summaries)
-        for elem in branches:
-            res.loc[elem, :] = 0
-
-            # Filling the table accordingly to the sums
-            if elem in prohibition_counts.index.tolist():
-                res.loc[elem, "prohibition"] += prohibition_counts.loc[elem]
-            if elem in all_counts.index.tolist():
-                res.loc[elem, "tasks"] += all_counts.loc[elem]
-
-            # Filling with checks count
-            if elem in checks_counts.index.tolist():
-                res.loc[elem, "checks"] += checks_counts.loc[elem]
-
-        # Filling the horizontal summary
-        checks_sum = checks_counts.sum()
-        prohibition_sum = prohibition_counts.sum()
-        all_sum = all_counts.sum()
-        res.loc[GlobalDefaults.pivot_name, "prohibition"] = prohibition_sum
-        res.loc[GlobalDefaults.pivot_name, "checks"] = checks_sum
-        res.loc[GlobalDefaults.pivot_name, "tasks"] = all_sum
-
-        # Filling N/A row
-        res.loc[GlobalDefaults.na_val, "prohibition"] = prohibition_sum - prohibition_counts.loc[
-            GlobalDefaults.branches].sum()
-        res.loc[GlobalDefaults.na_val, "checks"] = checks_sum - checks_counts.loc[GlobalDefaults.branches].sum()
-        res.loc[GlobalDefaults.na_val, "tasks"] = all_sum - all_counts.loc[GlobalDefaults.branches].sum()
-
-        # Filling the actual N/As
-        res.fillna(0, inplace=True)
-
-        # Filling the vertical summary
-        for row in branches:
-            if res.loc[row, "checks"] != 0:
-                res.loc[row, "prohib rel"] += res.loc[row, "prohibition"] / res.loc[row, "checks"]
-                res.loc[row, "all rel"] += res.loc[row, "tasks"] / res.loc[row, "checks"]
-
-        return res
+        # A single grouped count for each table, the pivot is formed from the counts
+        return main_pivot(count_rows(source_table, [branch, prohibition]), count_rows(checks_table, [branch]),
+                          prohibition, branch)
 
     @staticmethod
     def _form_parks_pivot(source_table: pd.DataFrame,
@@ -214,261 +226,62 @@ class Pivots:
                           park: str = None,
                           prohibition: str = None,
                           top_count: int = 5):
-        # Organizing pivot table's structure
-        parks = [i.lower() for i in source_table[park].unique().tolist()]
-        tmp_res = pd.DataFrame(columns=["prohibition", "tasks", "checks", "all rel", "prohib rel"], index=parks)
-
-        # Counting the required values
-        prohibition_counts = source_table[source_table[prohibition].apply(lambda x: str(x).lower()) ==
-                                          SystemDefaults.prohibition_strict][park].value_counts()
-        all_counts = source_table[park].value_counts()
-        checks_counts = checks_table[park].value_counts()
-
-        # Lowercasing indices
-        prohibition_counts.index = prohibition_counts.index.str.lower()
-        all_counts.index = all_counts.index.str.lower()
-        checks_counts.index = checks_counts.index.str.lower()
-
-        # Filling the pivot table with the source data (without summaries)
-        for elem in parks:
-            tmp_res.loc[elem, :] = 0
-
-            # Filling the table accordingly to the sums
-            if elem in prohibition_counts.index.tolist():
-                tmp_res.loc[elem, "prohibition"] += prohibition_counts.loc[elem]
-            if elem in all_counts.index.tolist():
-                tmp_res.loc[elem, "tasks"] += all_counts.loc[elem]
-
-            # Filling with checks count
-            if elem in checks_counts.index.tolist():
-                tmp_res.loc[elem, "checks"] += checks_counts.loc[elem]
-
-        # Filling the vertical summary
-        for row in parks:
-            if tmp_res.loc[row, "checks"] != 0:
-                tmp_res.loc[row, "prohib rel"] += tmp_res.loc[row, "prohibition"] / tmp_res.loc[row, "checks"]
-                tmp_res.loc[row, "all rel"] += tmp_res.loc[row, "tasks"] / tmp_res.loc[row, "checks"]
-
-        tmp_res["all rel"] = tmp_res["all rel"].astype(float)
-        tmp_res["prohib rel"] = tmp_res["prohib rel"].astype(float)
-
-        # Organizing top-n pivot
-        all_sorted = tmp_res.sort_values("all rel", ascending=False)
-        strict_sorted = tmp_res.sort_values("prohib rel", ascending=False)
-        all_parks = all_sorted.index.tolist()[: top_count]
-        strict_parks = strict_sorted.index.tolist()[: top_count]
-        new_indices = [("prohibition", elem) for elem in strict_parks] + [("all tasks", elem) for elem in all_parks]
-        new_indices = pd.MultiIndex.from_tuples(new_indices, names=["prohibition", "park"])
-        res = pd.DataFrame(columns=["tasks", "checks", "rel"], index=new_indices)
-
-        res.loc["prohibition", :] = (
-            tmp_res.nlargest(top_count, "prohib rel").loc[:, ["prohibition", "checks", "prohib rel"]].values)
-        res.loc["all tasks", :] = (
-            tmp_res.nlargest(top_count, "all rel").loc[:, ["tasks", "checks", "all rel"]].values)
-
-        return res
-
-    @staticmethod
-    def _form_top_tasks(source_table: pd.DataFrame, checks_table: pd.DataFrame, branch: str = None,
-                        observation: str = None, detailed_observation: str = None, top_count: int = 5) -> object:
-        _branches = [i.lower() for i in GlobalDefaults.branches]
-
-        # Forming a pivot from the tasks table
-        filtered_source = source_table[[branch, observation]]
-        pivot_source = pd.pivot_table(filtered_source, index=observation, columns=branch,
-                                      aggfunc=np.count_nonzero).fillna(0)
-        pivot_source.columns = pivot_source.columns.str.lower()
-        indices = []
-        for col in GlobalDefaults.branches:
-            indices.extend([(col, elem) for elem in pivot_source.nlargest(top_count, col).index.tolist()])
-
-        filtered_checks = checks_table[[BranchesDefaults.branch]]
-        filtered_checks.loc[:, ["extra_col"]] = "checks"
-        pivot_checks = pd.pivot_table(filtered_checks, index=branch, columns="extra_col",
-                                      aggfunc=np.count_nonzero).fillna(0)
-        pivot_checks.index = pivot_checks.index.str.lower()
-
-        # Filling the pivot
-        res = pd.DataFrame(
-            index=pd.MultiIndex.from_tuples(indices, names=[branch, observation]),
-            columns=[detailed_observation, "checks"])
-        for group in res.index.tolist():
-            res.loc[group, detailed_observation] = pivot_source.loc[group[1], group[0]]
-            res.loc[group, "checks"] = pivot_checks.loc[group[0], "checks"]
-
-        # Filling the horizontal summary
-        res["rel"] = res.loc[:, detailed_observation] / res.loc[:, "checks"]
-
-        # Adding totals to tasks pivot
-        pivot_source["company"] = pivot_source.loc[:, GlobalDefaults.branches].apply(lambda row: row.sum(), axis=1)
-        # Calculating checks total amount
-        total_checks = pivot_checks.apply(lambda col: col.sum(), axis=0).values[0]
-        # Taking top tasks overall
-        overall_top = pivot_source.nlargest(top_count, "company").index.tolist()
-        # Forming indices for summary addition
-        indices = [("company", elem) for elem in overall_top]
-
-        # Filling the total summary
-        bottom_summary = pd.DataFrame(
-            index=pd.MultiIndex.from_tuples(indices, names=[branch, observation]),
-            columns=res.columns.tolist())
-        for elem in overall_top:
-            bottom_summary.loc[("company", elem), detailed_observation] = pivot_source.loc[elem, "company"]
-            bottom_summary.loc[("company", elem), "checks"] = total_checks
-        bottom_summary.loc[:, "rel"] = bottom_summary.loc[:, detailed_observation] / bottom_summary.loc[:, "checks"]
-
-        # Adding the summary to the pivot
-        res = concat_tables([bottom_summary, res], axis="v", drop_indices=False)
-
-        return res
+        """
+        Forms a pivot with top parks by unit values (all and strict prohibitions separately)
+        :param source_table: source table to calculate a pivot from
+        :param checks_table: additional table needed for unit values calculation
+        :param park: park column name
+        :param prohibition: prohibition column name
+        :param top_count: number of parks in each part of the pivot
+        :return: pd.DataFrame
+        """
+        # A single grouped count for each table, the pivot is formed from the counts
+        return parks_pivot(count_rows(source_table, [park, prohibition]), count_rows(checks_table, [park]), park,
+                           prohibition, top_count)
 
     def _form_tasks_pivot(self, source_table: pd.DataFrame, checks_table: pd.DataFrame, prohibition: str = None,
                           observation: str = None, detailed_observation: str = None, branch: str = None, top_count: int = 3):
-        # Forming pivot with all tasks and with strict ones only
-        all_pivot = self._form_top_tasks(source_table, checks_table, branch, observation, detailed_observation, top_count)
-        strict_pivot = self._form_top_tasks(
-            source_table[source_table[prohibition] == SystemDefaults.prohibition_strict],
-            checks_table, branch, observation, detailed_observation, top_count)
-
-        # Adds one level to index and strips the task of the first numeric part
-        def custom_reidex(index_to_add: str, df: pd.DataFrame):
-            new_indices = []
-            for indx in df.index.tolist():
-                new_indices.append((indx[0], index_to_add, indx[1][indx[1].find(" ") + 1:]))
-            df.index = new_indices
-            return df
-
-        # Reindexing both pivots
-        all_pivot = custom_reidex("all tasks", all_pivot)
-        strict_pivot = custom_reidex("prohibition", strict_pivot)
-
-        # Merging them into a single one
-        res = concat_tables([all_pivot, strict_pivot], "v", drop_indices=False)
-
-        # Reindexing accordingly to the table indices
-        new_indices = pd.MultiIndex.from_tuples(res.index.tolist(), names=[branch, prohibition, observation])
-        res.index = new_indices
-
-        # Regrouping indices
-        res = res.groupby(level=0, sort=False).apply(lambda x: x).reset_index(level=0, drop=True)
-
-        return res
+        # Both tables are counted once for the all tasks and strict prohibitions parts
+        return tasks_pivot(count_rows(source_table, [branch, observation, prohibition]),
+                           count_rows(checks_table, [branch]), prohibition, observation, detailed_observation, branch,
+                           top_count)
 
     @staticmethod
     def _form_contract_top(tasks: pd.DataFrame, checks: pd.DataFrame, top_categories: list = None, observation: str = None,
-                       contract: str = None, branch: str = None, modification: str = None) -> pd.DataFrame | None:
-        if top_categories is None:
+                       contract: str = None, branch: str = None, modification: str = None) -> dict[str, pd.DataFrame] | None:
+        """
+        Forms a pivot with unit values of the top observation categories by modification groups. The source tables
+        are not modified
+        :param tasks: tasks table
+        :param checks: checks table
+        :param top_categories: observation categories to count
+        :param observation: observation category column name
+        :param contract: contract column name
+        :param branch: branch column name
+        :param modification: modification column name (or its part, since it could change its name)
+        :return: dictionary with the result pivot and the tasks and checks pivots, None on no top categories
+        """
+        if top_categories is None or len(top_categories) == 0:
             print("No top categories are set for the pivot. Skipping contract_top pivot...")
             return None
 
-        if len(top_categories) == 0:
-            print("No top categories are set for the pivot. Skipping contract_top pivot...")
+        # Parsing columns to determine a modification column (since it could change its name)
+        tasks_modification = find_modification(tasks, modification)
+        checks_modification = find_modification(checks, modification)
+        if tasks_modification is None or checks_modification is None:
+            print(f"No modification column found in the tasks or checks table. Skipping contract_top pivot...")
             return None
 
-        # Filtering tasks by top categories
+        # Grouping each table by its own modification column, then counting by branch-groups
         filtered_tasks = tasks[tasks[observation].isin(top_categories)]
-        tmp_checks = checks
-
-        # A small function for grouping
-        def group_modification(contract: str, modification: str):
-            tmp = modification.lower()
-            contract_condition = contract != "" and contract != GlobalDefaults.na_val
-            if "val_1" in tmp and contract_condition:
-                res = "VAL_1"
-            elif ("val_2" in tmp or "val_2_alt" in tmp) and contract_condition:
-                res = "VAL_2"
-            elif not contract_condition:
-                res = "VAL_3"
-            else:
-                res = "Other"
-            return res
-
-        # Parsing columns to determine a modification column (since it could change its name)
-        checks_modification = ""
-        tasks_modification = ""
-        for col in filtered_tasks.columns.tolist():
-            if modification in col:
-                tasks_modification = col
-        for col in checks.columns.tolist():
-            if modification in col:
-                checks_modification = col
-
-        tmp_checks.loc[:, ["group"]] = tmp_checks.apply(
-            lambda row: group_modification(row[contract], row[tasks_modification]), axis=1)
-        filtered_tasks.loc[:, ["group"]] = filtered_tasks.apply(
-            lambda row: group_modification(row[contract], row[checks_modification]), axis=1)
-
-        # Forming pivots by branch-groups
-        tasks_pivot = (pd.pivot_table(filtered_tasks[[observation, branch, "group"]],
-                                      index=[observation, branch], columns="group",
-                                      aggfunc=len, margins=True, margins_name="Total").
-                       fillna(0).rename_axis(index=[observation, branch]))
-
-        # Calculate the sum for each observation category
-        observation_sums = tasks_pivot.groupby(observation).sum()
-        observation_sums.index = [(indx, "total") for indx in observation_sums.index.tolist()]
-
-        # Filter out the ("total", "") row aka the original margin
-        tasks_pivot = tasks_pivot[~((tasks_pivot.index.get_level_values(observation) == "Total") & (
-                tasks_pivot.index.get_level_values(branch) == ""))]
-
-        # Append the bottom margin to the pivot table
-        tasks_pivot = concat_tables([tasks_pivot, observation_sums], axis="v")
-        checks_pivot = (pd.pivot_table(tmp_checks[[branch, "group"]],
-                                       index=branch, columns="group",
-                                       aggfunc=len, margins=True, margins_name="total").
-                        fillna(0).sort_values(by="total", ascending=False))
-
-        # Saving pivots for later output
-        tasks_for_writing = tasks_pivot.copy(deep=True).groupby(level=0, group_keys=False).apply(
-            lambda group: group.sort_values(by="total", ascending=False))
-        checks_for_writing = checks_pivot.copy(deep=True)
-
-        # Removing unnecessary data
-        if "Other" in tasks_pivot.columns.tolist():
-            tasks_pivot = tasks_pivot.drop(columns="Other")
-        if "Other" in checks_pivot.columns.tolist():
-            checks_pivot = checks_pivot.drop(columns="Other")
-
-        # Branches and modification groups validation
-        tasks_indices_diff = set(tasks_pivot.index.unique(level=1).tolist()) - set(checks_pivot.index.tolist())
-        tasks_columns_diff = set(tasks_pivot.columns.tolist()) - set(checks_pivot.columns.tolist())
-        with_errors = False
-        if len(tasks_indices_diff) != 0:
-            with_errors = True
-        if len(tasks_columns_diff) != 0:
-            with_errors = True
-        # The skip itself, though we return both pivots
-        if with_errors:
-            warnings.warn(f"Branches or modification groups mismatch for tasks and checks tables: "
-                          f"{tasks_indices_diff.union(tasks_columns_diff)}. Skipping contract top pivot...")
-            return {"tasks": tasks_for_writing, "checks": checks_for_writing}
-
-        # Creating the result pivot
-        res_pivot = pd.DataFrame(index=tasks_pivot.index.unique(level=0).tolist(),
-                                 columns=tasks_pivot.columns.tolist()).fillna(0)
-
-        # Filling the result
-        for row in res_pivot.index.tolist():
-            for col in res_pivot.columns.tolist():
-                if checks_pivot.loc["total", col] != 0:
-                    res_pivot.loc[row, col] = tasks_pivot.loc[(row, "total"), col] / checks_pivot.loc["total", col]
-                else:
-                    res_pivot.loc[row, col] = 0
-
-        # Some column reordering and reindexing
-        res_pivot = res_pivot[["VAL_3", "VAL_1", "VAL_2", "total"]]
-        reindex_list = []
-        for indx in res_pivot.index.tolist():
-            if " " in indx:
-                reindex_list.append(indx[indx.find(" ") + 1:])
-            else:
-                reindex_list.append(indx)
-        res_pivot.index = reindex_list
-
-        result = {"Pivot": res_pivot, "tasks": tasks_for_writing, "checks": checks_for_writing}
-
-        return result
+        tasks_groups = pd.DataFrame({observation: filtered_tasks[observation], branch: filtered_tasks[branch],
+                                     GROUP: group_modifications(filtered_tasks[contract],
+                                                                filtered_tasks[tasks_modification])})
+        checks_groups = pd.DataFrame({branch: checks[branch],
+                                      GROUP: group_modifications(checks[contract], checks[checks_modification])})
+
+        return contract_top(count_rows(tasks_groups, [observation, branch, GROUP]),
+                            count_rows(checks_groups, [branch, GROUP]), top_categories, observation, branch)
 
 
 # Some code here
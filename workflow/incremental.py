@@ -0,0 +1,322 @@
+"""
+A module contains an incremental store of the enriched System tables: only the new rows of a daily export are parsed,
+merged and filtered, the rest is taken from the store
+"""
+
+import os
+import pickle
+import warnings
+from datetime import datetime
+from typing import Literal
+
+import numpy as np
+import pandas as pd
+
+from excel_operations.excel_utils import date_to_datetime
+from excel_operations.merger import concat_tables
+from excel_operations.storage import dump_table, load_table
+from settings.defaults import SystemDefaults
+from workflow.another_system_addition import SystemAddition
+
+ROW_KEY = "row key"
+UNKNOWN_MONTH = "unknown"
+_KEY_SEPARATOR = "\x1f"
+_EXTENSIONS = (".parquet", ".feather", ".pkl")
+
+
+def row_keys(source: pd.DataFrame, task_header: str, creation_date: str) -> pd.Series:
+    """
+    Forms stable row keys: task header and creation date as they are in the export plus the occurrence number of the
+    pair, so the rows with the same header and date (or with no date) are kept apart. The numbers are given in the source
+    order, the rows are expected to keep their relative order between the exports
+    :param source: source table
+    :param task_header: task header column name
+    :param creation_date: creation date column name
+    :return: pd.Series of str keys with the source index, unique within the table
+    """
+    keys = source[task_header].astype(str) + _KEY_SEPARATOR + source[creation_date].astype(str)
+    occurrences = keys.groupby(keys, sort=False).cumcount()
+
+    return keys + _KEY_SEPARATOR + occurrences.astype(str)
+
+
+def month_partitions(source_col: pd.Series) -> np.ndarray:
+    """
+    Defines the month partition of each row by its creation date. Each unique date is parsed once
+    :param source_col: source date column
+    :return: array of 'YYYY-MM' strings, 'unknown' for the empty and incorrect dates
+    """
+    codes, uniques = pd.factorize(source_col.astype(object), use_na_sentinel=False)
+    months = np.full(len(uniques), UNKNOWN_MONTH, dtype=object)
+
+    is_valid = np.flatnonzero(~pd.isna(uniques))
+    parsed = date_to_datetime([uniques[i] for i in is_valid]) if len(is_valid) > 0 else []
+    for indx, val in zip(is_valid, parsed):
+        # Incorrect dates are converted to min datetime, time values without a date are put on its day as well
+        if pd.notna(val) and val.date() != datetime.min.date():
+            months[indx] = f"{val.year:04d}-{val.month:02d}"
+
+    return months[codes]
+
+
+def _align_dtypes(tables: list[pd.DataFrame]) -> list[pd.DataFrame]:
+    """
+    Datetime columns might be read with different units (e.g., the ones with out-of-bounds dates), such columns are
+    converted to objects, so the tables could be concatenated
+    :param tables: list of tables
+    :return: list of tables with aligned datetime columns
+    """
+    dtypes: dict[str, set] = {}
+    for table in tables:
+        for col, dtype in table.dtypes.items():
+            dtypes.setdefault(col, set()).add(dtype)
+    to_object = {col: object for col, val in dtypes.items()
+                 if len(val) > 1 and any(pd.api.types.is_datetime64_any_dtype(i) for i in val)}
+    if len(to_object) == 0:
+        return tables
+
+    return [table.astype({col: val for col, val in to_object.items() if col in table.columns}) for table in tables]
+
+
+class EnrichmentStore:
+    """
+    Local store of the enriched and filtered System table (see SystemAddition), partitioned by the creation month. \n
+    A row is identified by its task header and creation date. On each update only the rows with the keys not seen
+    before are processed, the keys of the filtered out rows are kept as well, so they are not processed again.
+    The rows are considered immutable: to re-process a changed month use invalidate()
+    """
+
+    def __init__(self,
+                 store_dir: str,
+                 file_type: Literal["tasks", "checks"] = "tasks",
+                 fmt: Literal["parquet", "feather", "pickle"] = "parquet"):
+        """
+        :param store_dir: store folder. Created if it doesn't exist
+        :param file_type: file type to store (see SystemAddition)
+        :param fmt: storage format of the partitions. Falls back to pickle if the table couldn't be written
+        """
+        self.file_type = file_type
+        self.fmt = fmt
+        self._data_dir = os.path.join(store_dir, file_type, "data")
+        self._keys_dir = os.path.join(store_dir, file_type, "keys")
+        # Column dtypes of the enriched table: the storage formats don't keep some of them (e.g., object columns of
+        # datetimes are read as datetime64 ones), so they are restored on reading
+        self._schema_path = os.path.join(store_dir, file_type, "schema.pkl")
+
+        os.makedirs(self._data_dir, exist_ok=True)
+        os.makedirs(self._keys_dir, exist_ok=True)
+
+    @staticmethod
+    def _find(folder: str, month: str) -> str | None:
+        """
+        Looks up for the partition file regardless of its format
+        :param folder: partitions folder
+        :param month: partition name
+        :return: full path to the file, None if there is no partition
+        """
+        for ext in _EXTENSIONS:
+            full_path = os.path.join(folder, month + ext)
+            if os.path.isfile(full_path):
+                return full_path
+
+        return None
+
+    @staticmethod
+    def _months(folder: str) -> list[str]:
+        """
+        :param folder: partitions folder
+        :return: sorted names of the stored partitions
+        """
+        return sorted({os.path.splitext(i)[0] for i in os.listdir(folder) if i.endswith(_EXTENSIONS)})
+
+    def _read(self, folder: str, month: str) -> pd.DataFrame | None:
+        """
+        Reads a partition
+        :param folder: partitions folder
+        :param month: partition name
+        :return: pd.DataFrame, None if there is no partition
+        """
+        full_path = self._find(folder, month)
+        if full_path is None:
+            return None
+
+        res = load_table(full_path)
+        if folder == self._data_dir:
+            res = self._restore_dtypes(res)
+
+        return res
+
+    def _read_schema(self) -> dict:
+        """
+        :return: dictionary {column name: dtype} of the stored table, empty if nothing is stored yet
+        """
+        if not os.path.isfile(self._schema_path):
+            return {}
+        with open(self._schema_path, "rb") as file:
+            return pickle.load(file)
+
+    def _update_schema(self, table: pd.DataFrame) -> None:
+        """
+        Adds the dtypes of the table columns to the schema, the stored columns keep their dtypes
+        :param table: enriched table
+        :return: None
+        """
+        schema = self._read_schema()
+        new_cols = {col: dtype for col, dtype in table.dtypes.items() if col not in schema}
+        if len(new_cols) == 0:
+            return
+        schema.update(new_cols)
+        with open(self._schema_path, "wb") as file:
+            pickle.dump(schema, file)
+
+    def _restore_dtypes(self, table: pd.DataFrame) -> pd.DataFrame:
+        """
+        Casts the read partition columns back to the enriched table dtypes. Missing values of object columns are
+        read as None, they are replaced with NaN as they are in the enriched table
+        :param table: read partition
+        :return: pd.DataFrame
+        """
+        schema = self._read_schema()
+        res = table.copy(deep=False)
+        for col in res.columns:
+            dtype = schema.get(col)
+            if dtype is None:
+                continue
+            if res[col].dtype != dtype:
+                try:
+                    res[col] = res[col].astype(dtype)
+                except (ValueError, TypeError) as err:
+                    warnings.warn(f"Unable to restore {col} column dtype {dtype}: {err.__str__()}")
+                    continue
+            if dtype == object:
+                res[col] = res[col].where(res[col].notna(), np.nan)
+
+        return res
+
+    def _write(self, folder: str, month: str, table: pd.DataFrame) -> None:
+        """
+        Writes a partition replacing the existing one
+        :param folder: partitions folder
+        :param month: partition name
+        :param table: partition table
+        :return: None
+        """
+        old_path = self._find(folder, month)
+        base_path = os.path.join(folder, month)
+        try:
+            new_path = dump_table(table.reset_index(drop=True), base_path, self.fmt)
+        except (ValueError, TypeError, NotImplementedError) as err:
+            warnings.warn(f"Unable to write partition {month} as {self.fmt}, using pickle instead: {err.__str__()}")
+            new_path = dump_table(table.reset_index(drop=True), base_path, "pickle")
+
+        if old_path is not None and old_path != new_path:
+            os.remove(old_path)
+
+    def seen_keys(self) -> pd.Index:
+        """
+        :return: keys of all the processed rows (including the filtered out ones)
+        """
+        keys = [self._read(self._keys_dir, month)[ROW_KEY] for month in self._months(self._keys_dir)]
+        if len(keys) == 0:
+            return pd.Index([], dtype=object)
+
+        return pd.Index(pd.concat(keys, ignore_index=True))
+
+    def update(self, source: pd.DataFrame, **kwargs) -> pd.DataFrame | None:
+        """
+        Processes the new rows of the source table and adds them to the store
+        :param source: the source table, e.g. the whole year-to-date export
+        :param kwargs: SystemAddition parameters except the source table and file type
+        :return: the enriched new rows, None if there were no new rows or all of them were filtered out
+        """
+        print(f"Updating the {self.file_type} store...")
+        if source is None or source.empty:
+            print("The source table doesn't exist or is empty. Nothing to update")
+            return None
+
+        _task_header = str(kwargs.get("task_header") or SystemDefaults.task_header).lower()
+        _creation_date = str(kwargs.get("creation_date") or SystemDefaults.creation_date).lower()
+        if _task_header not in source.columns or _creation_date not in source.columns:
+            warnings.warn(f"Row key columns are not represented in the source table: {_task_header}, "
+                          f"{_creation_date}. Nothing to update", category=UserWarning)
+            return None
+
+        # Looking for the new rows
+        keys = row_keys(source, _task_header, _creation_date)
+        is_new = ~keys.isin(self.seen_keys()).to_numpy()
+        if not is_new.any():
+            print("No new rows found")
+            return None
+        delta = source[is_new].reset_index(drop=True)
+        delta_keys = keys[is_new].reset_index(drop=True)
+        print(f"New rows found: {len(delta.index)} of {len(source.index)}")
+
+        # Parsing, merging and filtering the new rows only. The keys go through as a column, since they can't be
+        # formed again from the filtered rows
+        kwargs["file_type"] = self.file_type
+        enriched = SystemAddition(delta.assign(**{ROW_KEY: delta_keys}), **kwargs).table
+
+        if enriched is not None and not enriched.empty:
+            enriched = enriched.reset_index(drop=True)
+            self._update_schema(enriched)
+            enriched_months = month_partitions(enriched[_creation_date])
+            for month in np.unique(enriched_months):
+                part = enriched[enriched_months == month]
+                stored = self._read(self._data_dir, month)
+                # The rows might be stored already if the previous update was interrupted
+                if stored is not None:
+                    part = concat_tables(_align_dtypes([stored[~stored[ROW_KEY].isin(part[ROW_KEY])], part]),
+                                         axis="v", drop_indices=True)
+                # The same check might be split between the updates
+                if self.file_type == "checks" and kwargs.get("enable_filter", True):
+                    part = SystemAddition._drop_check_duplicates(part, _creation_date, _task_header)
+                self._write(self._data_dir, month, part)
+
+        # Keys are written the last, so the rows are processed again if the data wasn't written
+        delta_months = month_partitions(delta[_creation_date])
+        for month in np.unique(delta_months):
+            part = pd.DataFrame({ROW_KEY: delta_keys[delta_months == month].to_numpy()})
+            stored = self._read(self._keys_dir, month)
+            if stored is not None:
+                part = concat_tables([stored, part], axis="v", drop_indices=True)
+            self._write(self._keys_dir, month, part)
+
+        print(f"The {self.file_type} store updated successfully")
+        if enriched is None or enriched.empty:
+            return None
+
+        return enriched.drop(columns=[ROW_KEY])
+
+    def load(self, start: str = None, end: str = None) -> pd.DataFrame | None:
+        """
+        Collects the stored table, e.g. as a Pivots input
+        :param start: the first month to load, 'YYYY-MM'. Default is the earliest one
+        :param end: the last month to load, 'YYYY-MM'. Default is the latest one
+        :return: pd.DataFrame, None if there is nothing stored for the period
+        """
+        months = self._months(self._data_dir)
+        # Rows with incorrect dates can't be put in any period
+        if start is not None or end is not None:
+            months = [i for i in months if i != UNKNOWN_MONTH and (start is None or i >= start) and
+                      (end is None or i <= end)]
+
+        parts = [self._read(self._data_dir, month) for month in months]
+        if len(parts) == 0:
+            print(f"Nothing stored in the {self.file_type} store for the period")
+            return None
+
+        res = concat_tables(_align_dtypes(parts), axis="v", drop_indices=True)
+
+        return res.drop(columns=[ROW_KEY])
+
+    def invalidate(self, months: list[str] | str) -> None:
+        """
+        Removes the stored partitions, so their rows are processed again on the next update
+        :param months: partition name(s), 'YYYY-MM'
+        :return: None
+        """
+        for month in [months] if isinstance(months, str) else months:
+            for folder in (self._data_dir, self._keys_dir):
+                full_path = self._find(folder, month)
+                if full_path is not None:
+                    os.remove(full_path)
@@ -0,0 +1,109 @@
+"""
+A module contains a single-pass ingestion: all the source files are read at once and then split by their types
+"""
+
+import pandas as pd
+import excel_operations.io as io
+from settings.defaults import SystemDefaults, ResourcesDefaults, BranchesDefaults, ProductionDefaults
+
+PARTITIONS = ("tasks", "checks", "resources", "production", "branches")
+UNKNOWN_PARTITION = "unknown"
+
+
+def default_signatures() -> dict[str, list[str]]:
+    """
+    Forms header signatures for each table type based on the settings: a table is considered to be of a type if its
+    header contains all the signature columns. Production tables have no regular header, so they are classified by
+    the transport type names in the first column instead
+    :return: dictionary {table type: lowercased column names}
+    """
+    signatures = {
+        "tasks": [SystemDefaults.task_header, SystemDefaults.observation, SystemDefaults.creation_date,
+                  SystemDefaults.place, SystemDefaults.check_kind],
+        "checks": [SystemDefaults.task_header, SystemDefaults.observation, SystemDefaults.creation_date,
+                   SystemDefaults.appointed_to, SystemDefaults.check_type],
+        "resources": [ResourcesDefaults.garage_num, ResourcesDefaults.date, ResourcesDefaults.modification],
+        "branches": [BranchesDefaults.old_park_name, BranchesDefaults.park_name, BranchesDefaults.branch],
+    }
+
+    return {key: [str(i).lower() for i in val] for key, val in signatures.items()}
+
+
+def _is_production(table: pd.DataFrame) -> bool:
+    """
+    Checks whether the table looks like a production one: its first column contains transport type names
+    :param table: source table
+    :return: True if the table is considered to be a production one, False otherwise
+    """
+    if table.empty or ProductionDefaults.transport_type is None:
+        return False
+    transport_types = {str(i).lower() for i in ProductionDefaults.transport_type}
+    first_col = table.iloc[:, 0].astype(str).str.lower()
+
+    return bool(first_col.isin(transport_types).any())
+
+
+def classify_table(table: pd.DataFrame,
+                   signatures: dict[str, list[str]] = None,
+                   hint: str = None) -> str:
+    """
+    Defines the table type by its header signature. \n
+    If several types fit (e.g., tasks and checks exports might have the same columns), the hint is preferred,
+    then the most specific signature. If nothing fits, the hint is used as is
+    :param table: source table with lowercased headers
+    :param signatures: dictionary {table type: lowercased column names}. Default is default_signatures()
+    :param hint: expected table type, e.g. based on the source folder
+    :return: table type, 'unknown' if it couldn't be defined
+    """
+    _signatures = signatures if signatures is not None else default_signatures()
+    header = set(table.columns.tolist())
+
+    matches = [key for key, cols in _signatures.items() if set(cols) <= header]
+    if len(matches) == 0 and _is_production(table):
+        matches = ["production"]
+
+    if hint in matches:
+        return hint
+    if len(matches) > 0:
+        return max(matches, key=lambda key: len(_signatures.get(key, [])))
+    if hint is not None:
+        return hint
+
+    return UNKNOWN_PARTITION
+
+
+def read_partitioned(sources: dict[str, list[str] | str] | list[str] | str,
+                     signatures: dict[str, list[str]] = None,
+                     **kwargs) -> dict[str, list[pd.DataFrame]]:
+    """
+    Reads all the source files with a single io.read_xlsx_files() call (so the process pool is started once) and
+    splits the tables by their types
+    :param sources: dictionary {expected table type: file or folder path(s)} or just file or folder path(s). Expected types are used as hints only, each table is classified by its header anyway
+    :param signatures: dictionary {table type: lowercased column names}. Default is default_signatures()
+    :param kwargs: additional io.read_xlsx_files() parameters
+    :return: dictionary {table type: list of tables}. Contains all the types from PARTITIONS and 'unknown' one
+    """
+    # Collecting the paths, the first folder mentioned defines the hint
+    hints: dict[str, str | None] = {}
+    if isinstance(sources, dict):
+        for hint, paths in sources.items():
+            for path in io.collect_paths(paths, kwargs.get("extensions")):
+                hints.setdefault(path, hint)
+    else:
+        for path in io.collect_paths(sources, kwargs.get("extensions")):
+            hints.setdefault(path, None)
+
+    res: dict[str, list[pd.DataFrame]] = {key: [] for key in PARTITIONS + (UNKNOWN_PARTITION,)}
+    if len(hints) == 0:
+        print("No files to read by the current path(s)")
+        return res
+
+    kwargs["keep_paths"] = True
+    tables = io.read_xlsx_files(list(hints.keys()), **kwargs)
+
+    # Splitting by types
+    for path, table in tables.items():
+        res.setdefault(classify_table(table, signatures, hints[path]), []).append(table)
+
+    print("Tables read by types: " + ", ".join(f"{key}: {len(val)}" for key, val in res.items()))
+    return res
@@ -0,0 +1,641 @@
+"""
+A module contains incrementally maintained count aggregates of the System tables and the pivots derived from them
+(see another_system_reports.Pivots), so any date window can be reported without rescanning the raw rows
+"""
+import pickle
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from excel_operations.excel_utils import date_to_datetime
+from settings.defaults import SystemDefaults, GlobalDefaults, ResourcesDefaults, BranchesDefaults, ClassifierDefaults
+
+DATE_BUCKET = "date bucket"
+GROUP = "group"
+COUNT = "count"
+MODIFICATION_GROUPS = ["VAL_3", "VAL_1", "VAL_2"]
+# Order the keys were first added in, so the aggregates keep the source order of the rows (it defines the tops ties)
+_ORDER = "order"
+_NAT_DAY = np.datetime64("NaT", "ns").view(np.int64)
+
+
+def _lower(source_col: pd.Series) -> pd.Series:
+    """
+    Lowercases the string values, the rest are kept as is
+    :param source_col: source column
+    :return: pd.Series with the same index
+    """
+    return source_col.map(lambda x: x.lower() if isinstance(x, str) else x)
+
+
+def _safe_div(numerator: pd.Series, denominator: pd.Series) -> pd.Series:
+    """
+    Divides aligned series, the rows with zero denominator get 0
+    :param numerator: numerator values
+    :param denominator: denominator values
+    :return: pd.Series of floats with the numerator's index
+    """
+    num = numerator.to_numpy(dtype=float)
+    den = denominator.to_numpy(dtype=float)
+
+    return pd.Series(np.divide(num, den, out=np.zeros(len(num)), where=den != 0), index=numerator.index)
+
+
+def count_rows(table: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+    """
+    Counts the rows for each combination of the column values (empty values are kept as a separate value)
+    :param table: source table
+    :param columns: key column names
+    :return: pd.DataFrame with the key columns and the count column, keys are in their first appearance order.
+    Only the combinations present in the table are counted, including the categorical columns ones
+    """
+    return table.groupby(columns, sort=False, dropna=False, observed=True).size().reset_index(name=COUNT)
+
+
+def group_modifications(contract: pd.Series, modification: pd.Series) -> np.ndarray:
+    """
+    Groups the vehicles by their modification and contract. Each unique value is checked once
+    :param contract: contract column
+    :param modification: modification column
+    :return: array of the group names
+    """
+    contract_codes, contract_uniques = pd.factorize(contract.astype(object), use_na_sentinel=False)
+    modification_codes, modification_uniques = pd.factorize(modification.astype(object), use_na_sentinel=False)
+
+    contract_uniques = pd.Series(contract_uniques, dtype=object)
+    has_contract = ((contract_uniques != "") & (contract_uniques != GlobalDefaults.na_val)).to_numpy()[contract_codes]
+    modification_uniques = pd.Series(modification_uniques, dtype=object).astype(str).str.lower()
+    is_val_1 = modification_uniques.str.contains("val_1", regex=False).to_numpy()[modification_codes]
+    is_val_2 = modification_uniques.str.contains("val_2", regex=False).to_numpy()[modification_codes]
+
+    return np.select([is_val_1 & has_contract, is_val_2 & has_contract, ~has_contract],
+                     ["VAL_1", "VAL_2", "VAL_3"], default="Other").astype(object)
+
+
+def find_modification(table: pd.DataFrame, modification: str) -> str | None:
+    """
+    Looks up for the modification column, since it could change its name (e.g., get a suffix after merging)
+    :param table: source table
+    :param modification: modification column name
+    :return: the last column name containing the modification one, None if there is no such
+    """
+    res = None
+    for col in table.columns.tolist():
+        if modification in col:
+            res = col
+
+    return res
+
+
+def main_pivot(tasks_counts: pd.DataFrame, checks_counts: pd.DataFrame, prohibition: str,
+               branch: str) -> pd.DataFrame:
+    """
+    Forms a pivot with branches indices and observations count (all and strict prohibitions separately) \n
+    Counts total company summary, N/A branch numbers and unit values for each branch
+    :param tasks_counts: tasks counts (see count_rows()), must contain branch and prohibition columns
+    :param checks_counts: checks counts, must contain branch column
+    :param prohibition: prohibition column name
+    :param branch: branch column name
+    :return: pd.DataFrame
+    """
+    branches = GlobalDefaults.branches + [GlobalDefaults.na_val, GlobalDefaults.pivot_name]
+    is_strict = (_lower(tasks_counts[prohibition].astype(str)) == SystemDefaults.prohibition_strict).to_numpy()
+
+    # Empty branches are skipped by the groupby, as value_counts() does
+    tasks_branches = _lower(tasks_counts[branch])
+    all_counts = tasks_counts[COUNT].groupby(tasks_branches, observed=True).sum()
+    prohibition_counts = tasks_counts.loc[is_strict, COUNT].groupby(tasks_branches[is_strict], observed=True).sum()
+    checks_counts = checks_counts[COUNT].groupby(_lower(checks_counts[branch]), observed=True).sum()
+
+    res = pd.DataFrame({"prohibition": prohibition_counts.reindex(branches, fill_value=0),
+                        "tasks": all_counts.reindex(branches, fill_value=0),
+                        "checks": checks_counts.reindex(branches, fill_value=0)}, index=branches).astype(np.int64)
+
+    # Summary and N/A rows: everything beyond the configured branches goes to N/A
+    for col, counts in (("prohibition", prohibition_counts), ("tasks", all_counts), ("checks", checks_counts)):
+        res.loc[GlobalDefaults.pivot_name, col] = counts.sum()
+        res.loc[GlobalDefaults.na_val, col] = counts.sum() - counts.reindex(GlobalDefaults.branches,
+                                                                            fill_value=0).sum()
+
+    res["all rel"] = _safe_div(res["tasks"], res["checks"])
+    res["prohib rel"] = _safe_div(res["prohibition"], res["checks"])
+
+    return res
+
+
+def parks_pivot(tasks_counts: pd.DataFrame, checks_counts: pd.DataFrame, park: str, prohibition: str,
+                top_count: int = 5) -> pd.DataFrame:
+    """
+    Forms a pivot with top parks by unit values (all and strict prohibitions separately). Parks are taken from the tasks
+    :param tasks_counts: tasks counts (see count_rows()), must contain park and prohibition columns
+    :param checks_counts: checks counts, must contain park column
+    :param park: park column name
+    :param prohibition: prohibition column name
+    :param top_count: number of parks in each part of the pivot
+    :return: pd.DataFrame
+    """
+    tasks_parks = _lower(tasks_counts[park])
+    parks = pd.unique(tasks_parks.dropna())
+    is_strict = (_lower(tasks_counts[prohibition].astype(str)) == SystemDefaults.prohibition_strict).to_numpy()
+
+    tmp_res = pd.DataFrame({
+        "prohibition": tasks_counts.loc[is_strict, COUNT].groupby(tasks_parks[is_strict], observed=True).sum(),
+        "tasks": tasks_counts[COUNT].groupby(tasks_parks, observed=True).sum(),
+        "checks": checks_counts[COUNT].groupby(_lower(checks_counts[park]), observed=True).sum()
+    }).reindex(parks).fillna(0).astype(np.int64)
+    tmp_res["all rel"] = _safe_div(tmp_res["tasks"], tmp_res["checks"])
+    tmp_res["prohib rel"] = _safe_div(tmp_res["prohibition"], tmp_res["checks"])
+
+    # Organizing top-n pivot
+    strict_top = tmp_res.sort_values("prohib rel", ascending=False).head(top_count)[["prohibition", "checks",
+                                                                                     "prohib rel"]]
+    all_top = tmp_res.sort_values("all rel", ascending=False).head(top_count)[["tasks", "checks", "all rel"]]
+    strict_top.columns = all_top.columns = ["tasks", "checks", "rel"]
+    res = pd.concat([strict_top, all_top], axis=0)
+    res.index = pd.MultiIndex.from_tuples([("prohibition", i) for i in strict_top.index.tolist()] +
+                                          [("all tasks", i) for i in all_top.index.tolist()],
+                                          names=["prohibition", "park"])
+
+    return res
+
+
+def observation_matrix(tasks_counts: pd.DataFrame, branch: str, observation: str) -> pd.DataFrame:
+    """
+    Forms an observation categories by branches matrix. The configured branches are always present, the company total
+    (the sum of the configured branches) is added as well
+    :param tasks_counts: tasks counts (see count_rows()), must contain branch and observation columns
+    :param branch: branch column name
+    :param observation: observation category column name
+    :return: pd.DataFrame with the sorted categories as the index and the lowercased branches as the columns
+    """
+    valid = tasks_counts[branch].notna().to_numpy() & tasks_counts[observation].notna().to_numpy()
+    valid_counts = tasks_counts[valid]
+    res = (valid_counts[COUNT].groupby([valid_counts[observation], _lower(valid_counts[branch])], observed=True).sum()
+           .unstack(fill_value=0))
+    res = res.reindex(columns=res.columns.union(GlobalDefaults.branches, sort=False), fill_value=0).astype(np.int64)
+    res["company"] = res[GlobalDefaults.branches].sum(axis=1)
+
+    return res
+
+
+def top_tasks(pivot_source: pd.DataFrame, checks_total: pd.Series, branch: str, observation: str,
+              detailed_observation: str, top_count: int = 5) -> pd.DataFrame:
+    """
+    Forms a pivot with the top observation categories for each branch and the whole company with their unit values
+    :param pivot_source: observation categories by branches matrix (see observation_matrix())
+    :param checks_total: checks count by the lowercased branches
+    :param branch: branch column name
+    :param observation: observation category column name
+    :param detailed_observation: name of the tasks count column in the pivot
+    :param top_count: number of categories for each branch
+    :return: pd.DataFrame
+    """
+    # Top categories of all the branches at once, the company summary goes first. The stable sorting keeps the first
+    # category on equal counts (as nlargest() does)
+    columns = ["company"] + GlobalDefaults.branches
+    matrix = pivot_source[columns].to_numpy()
+    top_rows = np.argsort(-matrix, axis=0, kind="stable")[:top_count].T
+    top_cols = np.broadcast_to(np.arange(len(columns))[:, None], top_rows.shape)
+
+    # Checks are joined by the branch
+    checks = checks_total.reindex(columns, fill_value=0).to_numpy()
+    checks[0] = checks_total.sum()
+
+    res = pd.DataFrame({detailed_observation: matrix[top_rows, top_cols].ravel(),
+                        "checks": checks[top_cols].ravel()},
+                       index=pd.MultiIndex.from_arrays([np.array(columns, dtype=object)[top_cols.ravel()],
+                                                        pivot_source.index.to_numpy()[top_rows.ravel()]],
+                                                       names=[branch, observation])).astype(np.int64)
+    res["rel"] = _safe_div(res[detailed_observation], res["checks"])
+
+    return res
+
+
+def tasks_pivot(tasks_counts: pd.DataFrame, checks_counts: pd.DataFrame, prohibition: str, observation: str,
+                detailed_observation: str, branch: str, top_count: int = 3) -> pd.DataFrame:
+    """
+    Forms top observation categories pivots for all tasks and for the strict prohibitions only, joined by branches
+    :param tasks_counts: tasks counts (see count_rows()), must contain branch, observation and prohibition columns
+    :param checks_counts: checks counts, must contain branch column
+    :param prohibition: prohibition column name
+    :param observation: observation category column name
+    :param detailed_observation: name of the tasks count column in the pivot
+    :param branch: branch column name
+    :param top_count: number of categories for each branch
+    :return: pd.DataFrame
+    """
+    # Checks are counted once for both parts, as well as the categories matrices
+    checks_total = checks_counts[COUNT].groupby(_lower(checks_counts[branch]), observed=True).sum()
+    is_strict = (tasks_counts[prohibition] == SystemDefaults.prohibition_strict).to_numpy()
+    all_matrix = observation_matrix(tasks_counts, branch, observation)
+    strict_matrix = observation_matrix(tasks_counts[is_strict], branch, observation)
+
+    parts = []
+    for name, matrix in (("all tasks", all_matrix), ("prohibition", strict_matrix)):
+        part = top_tasks(matrix, checks_total, branch, observation, detailed_observation, top_count)
+        # Stripping the category of the first numeric part
+        part.index = [(i[0], name, i[1][i[1].find(" ") + 1:]) for i in part.index.tolist()]
+        parts.append(part)
+    res = pd.concat(parts, axis=0)
+
+    # Regrouping the rows by branches
+    res = res.iloc[np.argsort(pd.factorize(pd.Index([i[0] for i in res.index]))[0], kind="stable")]
+    res.index = pd.MultiIndex.from_tuples(res.index.tolist(), names=[branch, prohibition, observation])
+
+    return res
+
+
+def contract_top(tasks_counts: pd.DataFrame, checks_counts: pd.DataFrame, top_categories: list, observation: str,
+                 branch: str) -> dict[str, pd.DataFrame] | None:
+    """
+    Forms a pivot with unit values of the top observation categories by modification groups
+    (see group_modifications())
+    :param tasks_counts: tasks counts (see count_rows()), must contain observation, branch and group columns
+    :param checks_counts: checks counts, must contain branch and group columns
+    :param top_categories: observation categories to count
+    :param observation: observation category column name
+    :param branch: branch column name
+    :return: dictionary with the result pivot and the tasks and checks ones, None on no top categories
+    """
+    if top_categories is None or len(top_categories) == 0:
+        print("No top categories are set for the pivot. Skipping contract_top pivot...")
+        return None
+
+    # Tasks pivot: categories by branches with the totals for each category and the overall one
+    filtered = tasks_counts[tasks_counts[observation].isin(top_categories).to_numpy()]
+    tasks = (filtered.groupby([observation, branch, GROUP], observed=True)[COUNT].sum().unstack(fill_value=0)
+             .astype(np.int64))
+    tasks["total"] = tasks.sum(axis=1)
+    category_sums = tasks.groupby(level=0, observed=True).sum()
+    category_sums.loc["total"] = tasks.sum(axis=0)
+    category_sums.index = pd.MultiIndex.from_tuples([(i, "total") for i in category_sums.index.tolist()])
+    tasks = pd.concat([tasks, category_sums], axis=0).rename_axis(index=[observation, branch])
+
+    # Checks pivot: branches by groups with the totals
+    checks = checks_counts.groupby([branch, GROUP], observed=True)[COUNT].sum().unstack(fill_value=0).astype(np.int64)
+    checks["total"] = checks.sum(axis=1)
+    checks.loc["total"] = checks.sum(axis=0)
+    checks = checks.sort_values(by="total", ascending=False, kind="stable")
+
+    # Saving pivots for later output
+    tasks_for_writing = tasks.groupby(level=0, group_keys=False, observed=True).apply(
+        lambda group: group.sort_values(by="total", ascending=False, kind="stable"))
+    checks_for_writing = checks.copy()
+
+    # Branches and modification groups validation
+    tasks, checks = tasks.drop(columns="Other", errors="ignore"), checks.drop(columns="Other", errors="ignore")
+    diff = ((set(tasks.index.unique(level=1).tolist()) - set(checks.index.tolist())) |
+            (set(tasks.columns.tolist()) - set(checks.columns.tolist())))
+    if len(diff) != 0:
+        warnings.warn(f"Branches or modification groups mismatch for tasks and checks tables: {diff}. "
+                      f"Skipping contract top pivot...")
+        return {"tasks": tasks_for_writing, "checks": checks_for_writing}
+
+    # Unit values of the category totals: aligned by the groups, zero checks give zero
+    category_totals = tasks.xs("total", level=1)
+    checks_totals = checks.loc["total"].reindex(category_totals.columns).to_numpy(dtype=float)
+    res = pd.DataFrame(np.divide(category_totals.to_numpy(dtype=float), checks_totals,
+                                 out=np.zeros(category_totals.shape), where=checks_totals != 0),
+                       index=category_totals.index, columns=category_totals.columns)
+    res = res.reindex(columns=MODIFICATION_GROUPS + ["total"], fill_value=0.)
+    res.index = [i[i.find(" ") + 1:] if " " in i else i for i in res.index.tolist()]
+
+    return {"Pivot": res, "tasks": tasks_for_writing, "checks": checks_for_writing}
+
+
+def date_windows(dates, freq: str) -> dict[str, tuple[pd.Timestamp, pd.Timestamp]]:
+    """
+    Splits the dates into calendar periods. Only the periods with at least one date are returned
+    :param dates: dates (anything pd.to_datetime accepts), NaT are skipped
+    :param freq: pandas period alias, e.g. 'W' (weeks), 'M' (months), 'Q' (quarters), 'Y' (years)
+    :return: dictionary {period name: (first day, last day)} in chronological order
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(pd.Series(dates), errors="coerce")).dropna().unique()
+    periods = dates.to_period(freq).unique().sort_values()
+
+    return {str(i): (i.start_time.normalize(), i.end_time.normalize()) for i in periods}
+
+
+def top_categories(tasks_counts: pd.DataFrame, observation: str, count: int = 3) -> list:
+    """
+    :param tasks_counts: tasks counts (see count_rows()), must contain observation column
+    :param observation: observation category column name
+    :param count: number of categories
+    :return: the most frequent observation categories
+    """
+    return tasks_counts[COUNT].groupby(tasks_counts[observation], observed=True).sum().nlargest(count).index.tolist()
+
+
+class PivotAggregates:
+    """
+    Row counts of the tasks and checks tables keyed by the date (day), branch, park, modification group and (for
+    tasks) observation category and prohibition. \n
+    The counts are stored by days: adding new rows costs O(new rows) for counting plus the regrouping of the days
+    the new rows belong to. The pivots for any date window are derived from the counts of the window days
+    """
+
+    def __init__(self,
+                 prohibition: str = None,
+                 branch: str = None,
+                 park: str = None,
+                 observation: str = None,
+                 contract: str = None,
+                 modification: str = None,
+                 creation_date: str = None):
+        """
+        :param prohibition: prohibition column name
+        :param branch: branch column name
+        :param park: park column name
+        :param observation: observation category column name
+        :param contract: contract column name
+        :param modification: modification column name (or its part, see find_modification())
+        :param creation_date: creation date column name
+        """
+        self.prohibition = str(prohibition or SystemDefaults.prohibition).lower()
+        self.branch = str(branch or BranchesDefaults.branch).lower()
+        self.park = str(park or BranchesDefaults.park_name).lower()
+        self.observation = str(observation or ClassifierDefaults.new_task).lower()
+        self.contract = str(contract or SystemDefaults.contract).lower()
+        self.modification = str(modification or ResourcesDefaults.modification).lower()
+        self.creation_date = str(creation_date or SystemDefaults.creation_date).lower()
+
+        self._checks_keys = [DATE_BUCKET, self.branch, self.park, GROUP]
+        self._tasks_keys = self._checks_keys + [self.observation, self.prohibition]
+        # {day (int64 nanoseconds, NaT for the incorrect dates): counts of the day}
+        self._tasks_days: dict[int, pd.DataFrame] = {}
+        self._checks_days: dict[int, pd.DataFrame] = {}
+        self._added = 0
+
+    @property
+    def tasks(self) -> pd.DataFrame:
+        """
+        :return: tasks counts of all the days
+        """
+        return self._collect(self._tasks_days, self._tasks_keys)
+
+    @property
+    def checks(self) -> pd.DataFrame:
+        """
+        :return: checks counts of all the days
+        """
+        return self._collect(self._checks_days, self._checks_keys)
+
+    def _date_buckets(self, table: pd.DataFrame) -> np.ndarray:
+        """
+        Defines the day of each row. The parsed date column is used if it's in the table, each unique creation date
+        is parsed once otherwise
+        :param table: source table
+        :return: datetime64[ns] array of days, NaT for the incorrect dates
+        """
+        if GlobalDefaults.parsed_date in table.columns:
+            dates = pd.to_datetime(table[GlobalDefaults.parsed_date], errors="coerce")
+        else:
+            codes, uniques = pd.factorize(table[self.creation_date].astype(object), use_na_sentinel=False)
+            parsed = pd.to_datetime(pd.Series(date_to_datetime(list(uniques)), dtype=object), errors="coerce")
+            dates = pd.Series(parsed.to_numpy(dtype="datetime64[ns]")[codes])
+
+        return dates.dt.normalize().to_numpy(dtype="datetime64[ns]")
+
+    def _count(self, table: pd.DataFrame, keys: list[str]) -> pd.DataFrame | None:
+        """
+        Counts the table rows by the aggregate keys
+        :param table: source table
+        :param keys: aggregate key names
+        :return: counts, None if some of the columns are missing
+        """
+        columns = [i for i in keys if i not in (DATE_BUCKET, GROUP)] + [self.contract]
+        diff = set(columns + [self.creation_date]) - set(table.columns.tolist())
+        if len(diff) > 0:
+            warnings.warn(f"Not all of the columns are represented in the table: {diff}. No counts will be added",
+                          category=UserWarning)
+            return None
+
+        frame = pd.DataFrame({DATE_BUCKET: self._date_buckets(table)}, index=table.index)
+        for col in keys:
+            if col not in (DATE_BUCKET, GROUP):
+                frame[col] = table[col]
+        modification = find_modification(table, self.modification)
+        frame[GROUP] = None if modification is None else group_modifications(table[self.contract], table[modification])
+
+        return count_rows(frame[keys], keys)
+
+    def _merge(self, days: dict[int, pd.DataFrame], delta: pd.DataFrame, keys: list[str]) -> None:
+        """
+        Adds the new counts to the existing ones in place. Only the days of the new counts are regrouped.
+        The existing keys keep their order, the new ones are appended
+        :param days: existing counts by days
+        :param delta: new counts
+        :param keys: aggregate key names
+        :return: None
+        """
+        delta = delta.assign(**{_ORDER: np.arange(self._added, self._added + len(delta.index))})
+        self._added += len(delta.index)
+
+        day_keys = delta[DATE_BUCKET].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        for day, part in delta.groupby(day_keys, sort=False):
+            stored = days.get(day)
+            if stored is None:
+                days[day] = part.reset_index(drop=True)
+            else:
+                days[day] = pd.concat([stored, part], ignore_index=True) \
+                    .groupby(keys, sort=False, dropna=False, observed=True).agg({COUNT: "sum", _ORDER: "min"}) \
+                    .reset_index()
+
+    @staticmethod
+    def _collect(days: dict[int, pd.DataFrame], keys: list[str], start=None, end=None) -> pd.DataFrame:
+        """
+        Collects the counts of the window days in the order the keys were added
+        :param days: counts by days
+        :param keys: aggregate key names
+        :param start: the first day of the window. Default is no bound
+        :param end: the last day of the window (inclusive). Default is no bound
+        :return: counts of the window. Rows with incorrect dates are included only if no bounds are set
+        """
+        first = None if start is None else pd.Timestamp(start).normalize().value
+        last = None if end is None else pd.Timestamp(end).normalize().value
+        parts = [part for day, part in days.items()
+                 if (first is None and last is None) or
+                 (day != _NAT_DAY and (first is None or day >= first) and (last is None or day <= last))]
+        if len(parts) == 0:
+            return pd.DataFrame(columns=keys + [COUNT])
+
+        res = pd.concat(parts, ignore_index=True)
+        res = res.iloc[np.argsort(res[_ORDER].to_numpy(), kind="stable")]
+
+        return res.drop(columns=[_ORDER]).reset_index(drop=True)
+
+    def add(self, tasks: pd.DataFrame = None, checks: pd.DataFrame = None) -> None:
+        """
+        Adds the new rows to the aggregates, e.g. the ones returned by incremental.EnrichmentStore.update(). The rows
+        are expected to be enriched and filtered (see SystemAddition)
+        :param tasks: new tasks rows
+        :param checks: new checks rows
+        :return: None
+        """
+        if tasks is not None and not tasks.empty:
+            delta = self._count(tasks, self._tasks_keys)
+            if delta is not None:
+                self._merge(self._tasks_days, delta, self._tasks_keys)
+        if checks is not None and not checks.empty:
+            delta = self._count(checks, self._checks_keys)
+            if delta is not None:
+                self._merge(self._checks_days, delta, self._checks_keys)
+
+    def window(self, start=None, end=None) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Collects the counts of the date window. Rows with incorrect dates are included only if no bounds are set
+        :param start: the first day of the window (anything pd.Timestamp accepts). Default is no bound
+        :param end: the last day of the window (inclusive). Default is no bound
+        :return: tasks counts and checks counts
+        """
+        return (self._collect(self._tasks_days, self._tasks_keys, start, end),
+                self._collect(self._checks_days, self._checks_keys, start, end))
+
+    def pivots(self, start=None, end=None, top_count: int = 5, categories: list = None,
+               detailed_observation: str = None) -> dict | None:
+        """
+        Derives the Pivots report for the date window (see another_system_reports.Pivots)
+        :param start: the first day of the window. Default is no bound
+        :param end: the last day of the window (inclusive). Default is no bound
+        :param top_count: number of parks and categories in top pivots
+        :param categories: top categories for the category and contract pivots. Default are the 3 most frequent ones
+        :param detailed_observation: name of the tasks count column in the top tasks pivot
+        :return: dictionary {pivot name: pivot}, None if there are no counts for the window
+        """
+        tasks_counts, checks_counts = self.window(start, end)
+
+        return self._derive(tasks_counts, checks_counts, top_count, categories, detailed_observation)
+
+    def _derive(self, tasks_counts: pd.DataFrame, checks_counts: pd.DataFrame, top_count: int = 5,
+                categories: list = None, detailed_observation: str = None) -> dict | None:
+        """
+        Derives the Pivots report from the counts of a single window
+        :param tasks_counts: tasks counts of the window
+        :param checks_counts: checks counts of the window
+        :param top_count: number of parks and categories in top pivots
+        :param categories: top categories for the category and contract pivots. Default are the 3 most frequent ones
+        :param detailed_observation: name of the tasks count column in the top tasks pivot
+        :return: dictionary {pivot name: pivot}, None if there are no counts for the window
+        """
+        if tasks_counts.empty or checks_counts.empty:
+            print("No tasks or checks counted for the window. No pivots could be done")
+            return None
+
+        _detailed_observation = str(detailed_observation or ClassifierDefaults.task).lower()
+        _categories = categories
+        if _categories is None or len(_categories) == 0:
+            _categories = top_categories(tasks_counts, self.observation)
+
+        category_counts = tasks_counts[(tasks_counts[self.observation] == _categories[0]).to_numpy()]
+        has_groups = tasks_counts[GROUP].notna().all() and checks_counts[GROUP].notna().all()
+
+        return {"Main pivot": main_pivot(tasks_counts, checks_counts, self.prohibition, self.branch),
+                "Top tasks": tasks_pivot(tasks_counts, checks_counts, self.prohibition, self.observation,
+                                         _detailed_observation, self.branch, top_count),
+                "Top parks": parks_pivot(tasks_counts, checks_counts, self.park, self.prohibition, top_count),
+                "Top contract": contract_top(tasks_counts, checks_counts, _categories, self.observation,
+                                             self.branch) if has_groups else None,
+                "Top parks by category": parks_pivot(category_counts, checks_counts, self.park, self.prohibition,
+                                                     top_count)}
+
+    def batch_pivots(self, windows: dict | list = None, freq: str = None, top_count: int = 5,
+                     categories: list = None, detailed_observation: str = None) -> dict[str, dict]:
+        """
+        Derives the Pivots reports for several date windows at once. The counts are ordered by date once, each window
+        takes its rows by a binary search instead of filtering the whole counts
+        :param windows: list of (start, end) pairs or dictionary {window name: (start, end)}. Bounds are inclusive,
+        None means no bound (see window())
+        :param freq: pandas period alias ('W', 'M', 'Q', 'Y', etc.) to report each period of the counted dates.
+        Used if no windows are passed
+        :param top_count: number of parks and categories in top pivots
+        :param categories: top categories for the category and contract pivots. Default are the 3 most frequent ones
+        of each window
+        :param detailed_observation: name of the tasks count column in the top tasks pivot
+        :return: dictionary {window name: Pivots report}, the windows with no counts are skipped. Each report might be
+        passed to io.form_new_xlsx() as is
+        :raises ValueError: if neither windows nor freq is passed
+        """
+        if windows is None:
+            if freq is None:
+                raise ValueError("Either date windows or grouping frequency must be passed")
+            windows = date_windows(np.array(list(self._tasks_days) + list(self._checks_days), dtype=np.int64)
+                                   .view("datetime64[ns]"), freq)
+        elif not isinstance(windows, dict):
+            windows = {f"{'...' if start is None else pd.Timestamp(start).strftime('%Y-%m-%d')} - "
+                       f"{'...' if end is None else pd.Timestamp(end).strftime('%Y-%m-%d')}": (start, end)
+                       for start, end in windows}
+
+        # Sorting once. NaT go last, so they are never taken by a bounded window
+        sorted_counts = []
+        for counts in (self.tasks, self.checks):
+            dates = counts[DATE_BUCKET].to_numpy(dtype="datetime64[ns]")
+            order = np.argsort(dates, kind="stable")
+            sorted_counts.append((counts, order, dates[order], int(np.isnat(dates).sum())))
+
+        res = {}
+        for name, (start, end) in windows.items():
+            window_counts = []
+            for counts, order, dates, nat_count in sorted_counts:
+                left = 0 if start is None else np.searchsorted(
+                    dates, np.datetime64(pd.Timestamp(start).normalize(), "ns"), side="left")
+                right = len(dates) - nat_count if end is None else np.searchsorted(
+                    dates, np.datetime64(pd.Timestamp(end).normalize(), "ns"), side="right")
+                # Rows with incorrect dates are included only if no bounds are set, the same as window()
+                if start is None and end is None:
+                    right = len(dates)
+                # The counts keep their order, so the ties in tops are resolved the same way as in pivots()
+                window_counts.append(counts.iloc[np.sort(order[left:max(left, right)])])
+            print(f"Forming pivots for the window {name}...")
+            pivots = self._derive(window_counts[0], window_counts[1], top_count, categories, detailed_observation)
+            if pivots is not None:
+                res[name] = pivots
+
+        return res
+
+    def save(self, full_path: str) -> None:
+        """
+        Writes the aggregates to the disk
+        :param full_path: full path to the target file
+        :return: None
+        """
+        with open(full_path, "wb") as file:
+            pickle.dump(self, file)
+
+    @staticmethod
+    def load(full_path: str) -> "PivotAggregates":
+        """
+        Reads the aggregates written by save()
+        :param full_path: full path to the file
+        :return: PivotAggregates object
+        """
+        with open(full_path, "rb") as file:
+            return pickle.load(file)
+
+
+def batch_pivots(tasks: pd.DataFrame,
+                 checks: pd.DataFrame,
+                 windows: dict | list = None,
+                 freq: str = None,
+                 top_count: int = 5,
+                 categories: list = None,
+                 detailed_observation: str = None,
+                 **columns) -> dict[str, dict]:
+    """
+    Forms the Pivots reports for several date windows with a single scan of the tables: the rows are counted by day
+    once, then each window is derived from the counts (see PivotAggregates.batch_pivots())
+    :param tasks: tasks table, enriched and filtered (see SystemAddition)
+    :param checks: checks table, enriched and filtered (see SystemAddition)
+    :param windows: list of (start, end) pairs or dictionary {window name: (start, end)}, bounds are inclusive
+    :param freq: pandas period alias ('W', 'M', 'Q', 'Y', etc.) used if no windows are passed
+    :param top_count: number of parks and categories in top pivots
+    :param categories: top categories for the category and contract pivots. Default are the 3 most frequent ones
+    of each window
+    :param detailed_observation: name of the tasks count column in the top tasks pivot
+    :param columns: column names (see PivotAggregates)
+    :return: dictionary {window name: Pivots report}
+    """
+    aggregates = PivotAggregates(**columns)
+    aggregates.add(tasks, checks)
+
+    return aggregates.batch_pivots(windows, freq, top_count, categories, detailed_observation)